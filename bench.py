@@ -0,0 +1,179 @@
+"""
+bench.py
+Benchmark of the Computer's search
+
+The Computer searches each of a fixed set of positions
+to a fixed depth, with no time limit
+The positions evaluated, the time taken, the move chosen and its score
+are shown for each position, followed by the totals
+Below each position are the Aspiration Windows of the deepest depth
+with the positions evaluated in each - see run.aspiration_search
+Running it with a search feature switched on and then off
+shows what the feature is worth (an 'A/B' comparison)
+
+Run from the command line:
+    python3 run.py --bench                  to a depth of DEFAULT_BENCH_DEPTH
+    python3 run.py --bench 4                to a depth of 4 moves
+    python3 run.py --bench --no-null-move   without Null Move Pruning
+    python3 run.py --bench --no-lmr         without Late Move Reductions
+    python3 run.py --bench --no-aspiration  without Aspiration Windows
+    python3 run.py --bench --threads 4      with 1, 2 then 4 processes
+                                            to show the speedup
+    python3 run.py --bench --threads 4 --parallel root
+                                            likewise with Root-Parallel Search
+"""
+
+import time
+
+import constants
+import encoding
+import parallel
+import perft
+from game import Game
+from ordering import clear_move_ordering
+from transposition import TranspositionTable
+
+
+"""
+The Benchmark Positions
+Each is given in Forsyth-Edwards Notation (FEN)
+The Computer plays Black so Black is to move in each
+"""
+
+BENCH_POSITIONS = [
+    ("After 1. e4",
+     "rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq e3 0 1"),
+    ("Italian Game",
+     "r1bqk1nr/pppp1ppp/2n5/2b1p3/2B1P3/2P2N2/PP1P1PPP/RNBQK2R b KQkq - 0 4"),
+    ("Kiwipete",
+     "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R b KQkq - 0 1"),
+    ("Middlegame",
+     "r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 "
+     "b - - 0 10"),
+    ("Tactics",
+     "r2q1rk1/pP1p2pp/Q4n2/bbp1p3/Np6/1B3NBn/pPPP1PPP/R3K2R b KQ - 0 1"),
+    ("Rook Endgame",
+     "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 b - - 0 1"),
+    ("Pawn Endgame",
+     "8/5k2/3p4/1p1Pp2p/pP2Pp1P/P4P1K/8/8 b - - 0 1"),
+]
+
+# How deep the benchmark positions are searched by default
+DEFAULT_BENCH_DEPTH = 5
+
+
+def show_aspiration_windows():
+    """
+    Print the Aspiration Windows of the deepest depth of the latest search
+    Return a tuple: how many windows of the whole search
+    had to be searched again and how many positions they evaluated
+    """
+
+    re_searches = 0
+    re_search_nodes = 0
+    for (depth, alpha, beta, score, nodes) in Game.aspiration_windows:
+        if (score <= alpha and alpha > -constants.INFINITE_SCORE
+           or score >= beta and beta < constants.INFINITE_SCORE):
+            outcome = "fail low" if score <= alpha else "fail high"
+            re_searches += 1
+            re_search_nodes += nodes
+        else:
+            outcome = ""
+        if depth == Game.completed_depth:
+            print(f"    window {alpha:>7} {beta:>7}  "
+                  f"nodes {nodes:>9}  {outcome}".rstrip())
+    return (re_searches, re_search_nodes)
+
+
+def run_bench(think, name, fen, depth):
+    """
+    Search one position with 'think' (see run.py) to 'depth'
+    starting with an empty transposition table and move ordering tables
+    Print and return a tuple: the positions evaluated, the time taken
+    and the Aspiration Windows searched again and their positions
+    """
+
+    chess = Game()
+    perft.set_up_position(chess, fen)
+    if parallel.shared_table is not None:
+        # Shared with the worker processes so emptied rather than replaced
+        parallel.shared_table.clear()
+    else:
+        Game.transposition_table = TranspositionTable(
+            constants.TRANSPOSITION_TABLE_MB)
+    clear_move_ordering()
+    Game.search_nodes = 0
+
+    start = time.perf_counter()
+    score = think(chess, depth)
+    elapsed = time.perf_counter() - start
+
+    nodes = Game.search_nodes
+    nodes_per_second = nodes / elapsed if elapsed > 0 else 0
+    print(f"{name:<14} depth {Game.completed_depth}  nodes {nodes:>9}  "
+          f"{elapsed:7.2f}s  {nodes_per_second:>7.0f} nps  "
+          f"{encoding.move_text(Game.best_move):<6} {score:>6}")
+    (re_searches, re_search_nodes) = show_aspiration_windows()
+    return (nodes, elapsed, re_searches, re_search_nodes)
+
+
+def run_all_benches(think, depth):
+    """
+    Search every benchmark position to 'depth' then show the totals
+    Return the total time taken
+    """
+
+    total_nodes = 0
+    total_time = 0
+    total_re_searches = 0
+    total_re_search_nodes = 0
+    for (name, fen) in BENCH_POSITIONS:
+        (nodes, elapsed,
+         re_searches, re_search_nodes) = run_bench(think, name, fen, depth)
+        total_nodes += nodes
+        total_time += elapsed
+        total_re_searches += re_searches
+        total_re_search_nodes += re_search_nodes
+
+    print(f"{'Total':<14}          nodes {total_nodes:>9}  "
+          f"{total_time:7.2f}s  "
+          f"{total_nodes / total_time if total_time > 0 else 0:>7.0f} nps")
+    print(f"Aspiration Windows searched again {total_re_searches}  "
+          f"evaluating {total_re_search_nodes} positions")
+    return total_time
+
+
+def bench_command(think, depth=None, threads=1):
+    """
+    The '--bench' mode of run.py
+    Search every benchmark position to 'depth'
+    With more than one thread, do so with 1 thread, 2 threads,
+    4 threads ... up to 'threads' and show the speedup of each
+    i.e. how many times quicker it is than 1 thread
+    """
+
+    # Search to the given depth however long it takes
+    constants.SEARCH_TIME_SECONDS = None
+    constants.SEARCH_NODE_BUDGET = None
+    depth = depth or DEFAULT_BENCH_DEPTH
+
+    if threads <= 1:
+        run_all_benches(think, depth)
+        return
+
+    thread_counts = [1]
+    while thread_counts[-1] * 2 < threads:
+        thread_counts.append(thread_counts[-1] * 2)
+    thread_counts.append(threads)
+
+    times = []
+    for count in thread_counts:
+        print(f"{count} thread(s)")
+        parallel.start_process_pool(count)
+        times.append(run_all_benches(think, depth))
+    parallel.stop_process_pool()
+
+    print("Threads  Time      Speedup")
+    for (count, elapsed) in zip(thread_counts, times):
+        print(f"{count:>7}  {elapsed:7.2f}s  "
+              f"{times[0] / elapsed if elapsed > 0 else 0:6.2f}x")
@@ -0,0 +1,481 @@
+"""
+bitboards.py
+An alternative move generator built on 64-bit integer bitboards
+
+Game keeps one bitboard per colour and one per piece letter
+alongside the mailbox (see Game.set_square)
+A bitboard is a Python int whose bit number N is set
+when there is a piece on the square with bit number N
+Bit number 0 is a1, bit number 7 is h1, ... bit number 63 is h8
+
+'movelist' produces exactly the same moves as the mailbox routines
+in extras.py and 'is_square_attacked' gives the same answers as
+extras.is_square_attacked; constants.MOVE_GENERATOR selects which is used
+"""
+
+import json
+import os
+import random
+
+import constants
+
+
+"""
+Precomputed attack tables
+Each table is indexed by bit number and holds a bitboard
+of the squares that a piece on that square attacks
+"""
+
+
+def on_the_board(file, rank):
+    """
+    Are these file and rank numbers (counting from zero) on the board?
+    """
+    return 0 <= file < 8 and 0 <= rank < 8
+
+
+def build_step_table(steps):
+    """
+    Build the attack table for a piece that moves by single steps
+    i.e. a Knight or a King
+    'steps' is a list of (file difference, rank difference) tuples
+    """
+
+    table = []
+    for bit in range(64):
+        (file, rank) = (bit % 8, bit // 8)
+        attacks = 0
+        for (file_diff, rank_diff) in steps:
+            if on_the_board(file + file_diff, rank + rank_diff):
+                attacks |= 1 << (file + file_diff + 8 * (rank + rank_diff))
+        table.append(attacks)
+
+    return table
+
+
+KNIGHT_ATTACKS = build_step_table([(-1, -2), (-1, 2), (-2, -1), (-2, 1),
+                                   (1, -2), (1, 2), (2, -1), (2, 1)])
+
+KING_ATTACKS = build_step_table([(0, 1), (0, -1), (-1, 0), (1, 0),
+                                 (-1, 1), (1, 1), (-1, -1), (1, -1)])
+
+# The squares a pawn of each colour captures on
+PAWN_ATTACKS = {
+    constants.PLAYER: build_step_table([(-1, 1), (1, 1)]),
+    constants.COMPUTER: build_step_table([(-1, -1), (1, -1)])
+}
+
+# The square in front of a pawn of each colour
+PAWN_PUSHES = {
+    constants.PLAYER: build_step_table([(0, 1)]),
+    constants.COMPUTER: build_step_table([(0, -1)])
+}
+
+# The square two in front of a pawn that is still on its starting rank
+PAWN_DOUBLE_PUSHES = {
+    constants.PLAYER: [attacks if 8 <= bit < 16 else 0
+                       for bit, attacks
+                       in enumerate(build_step_table([(0, 2)]))],
+    constants.COMPUTER: [attacks if 48 <= bit < 56 else 0
+                         for bit, attacks
+                         in enumerate(build_step_table([(0, -2)]))]
+}
+
+"""
+Sliding pieces
+RAYS[direction][bit number] is a bitboard of every square
+from (but not including) that square to the edge of the board
+The directions are the change in bit number for one step;
+for the positive directions the nearest square on a ray is its lowest bit,
+for the negative directions it is its highest bit
+"""
+
+NORTH = 8
+SOUTH = -8
+EAST = 1
+WEST = -1
+NORTH_EAST = 9
+NORTH_WEST = 7
+SOUTH_EAST = -7
+SOUTH_WEST = -9
+
+DIRECTION_STEPS = {
+    NORTH: (0, 1), SOUTH: (0, -1), EAST: (1, 0), WEST: (-1, 0),
+    NORTH_EAST: (1, 1), NORTH_WEST: (-1, 1),
+    SOUTH_EAST: (1, -1), SOUTH_WEST: (-1, -1)
+}
+
+ROOK_DIRECTIONS = [NORTH, SOUTH, EAST, WEST]
+BISHOP_DIRECTIONS = [NORTH_EAST, NORTH_WEST, SOUTH_EAST, SOUTH_WEST]
+
+
+def build_rays(file_diff, rank_diff):
+    """
+    Build the rays from every square in one direction
+    """
+
+    rays = []
+    for bit in range(64):
+        (file, rank) = (bit % 8 + file_diff, bit // 8 + rank_diff)
+        ray = 0
+        while on_the_board(file, rank):
+            ray |= 1 << (file + 8 * rank)
+            (file, rank) = (file + file_diff, rank + rank_diff)
+        rays.append(ray)
+
+    return rays
+
+
+RAYS = {direction: build_rays(*steps)
+        for direction, steps in DIRECTION_STEPS.items()}
+
+
+def slider_attacks(bit, occupied, directions):
+    """
+    The squares attacked by a sliding piece on 'bit'
+    Each ray stops at (and includes) the first occupied square
+    This walks the rays; it is used to build the magic tables below
+    """
+
+    attacks = 0
+    for direction in directions:
+        ray = RAYS[direction][bit]
+        blockers = ray & occupied
+        if blockers:
+            if direction > 0:
+                first = (blockers & -blockers).bit_length() - 1
+            else:
+                first = blockers.bit_length() - 1
+            # Remove everything beyond the first blocker
+            ray ^= RAYS[direction][first]
+        attacks |= ray
+
+    return attacks
+
+
+"""
+Magic Bitboards
+Only the pieces on the squares of a slider's rays, leaving out the last
+square of each ray, can change the squares it attacks. These squares
+are the 'mask' of the slider's square. Multiplying the occupied squares
+under the mask by a 'magic' number gathers them into the top bits of
+the product; shifting those down gives an index into a table which
+holds the attacks for that arrangement of blockers
+
+    attacks = TABLE[bit][((occupied & MASK[bit]) * MAGIC[bit]
+                          & FULL_BOARD) >> SHIFT[bit]]
+
+The magic numbers are found by trial and error using a seeded random
+number generator so the same numbers are found every time
+As finding them takes a while, the magic numbers and their tables
+are saved to MAGICS_FILE_NAME and read back at the next startup
+They are only prepared the first time that 'movelist'
+or 'is_square_attacked' is called
+i.e. only when constants.MOVE_GENERATOR selects this move generator
+"""
+
+FULL_BOARD = (1 << 64) - 1
+MAGICS_FILE_NAME = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                constants.MAGICS_FILE_NAME)
+# Bump this if the layout of the saved file changes
+MAGICS_FILE_VERSION = 1
+MAGICS_SEED = 1953
+
+
+def build_masks(directions):
+    """
+    For each bit number, the squares on the rays in 'directions'
+    that could block the slider, i.e. the rays less their last square
+    """
+
+    masks = []
+    for bit in range(64):
+        mask = 0
+        for direction in directions:
+            ray = RAYS[direction][bit]
+            if ray:
+                last = (ray.bit_length() - 1 if direction > 0
+                        else (ray & -ray).bit_length() - 1)
+                mask |= ray ^ (1 << last)
+        masks.append(mask)
+
+    return masks
+
+
+ROOK_MASKS = build_masks(ROOK_DIRECTIONS)
+BISHOP_MASKS = build_masks(BISHOP_DIRECTIONS)
+ROOK_SHIFTS = [64 - bin(mask).count("1") for mask in ROOK_MASKS]
+BISHOP_SHIFTS = [64 - bin(mask).count("1") for mask in BISHOP_MASKS]
+
+
+def find_magic(bit, mask, shift, directions, random_numbers):
+    """
+    Find a magic number for 'bit' by trial and error
+    Return the magic number and its attack table
+    """
+
+    # Every arrangement of blockers under the mask
+    # and the squares attacked with that arrangement
+    blockers_list = []
+    attacks_list = []
+    blockers = 0
+    while True:
+        blockers_list.append(blockers)
+        attacks_list.append(slider_attacks(bit, blockers, directions))
+        # Move on to the next subset of the mask
+        blockers = (blockers - mask) & mask
+        if not blockers:
+            break
+
+    size = 1 << (64 - shift)
+    table = [0] * size
+    # Which attempt last filled each entry of 'table'
+    # This saves clearing the table before every attempt
+    filled_by = [0] * size
+    attempt = 0
+    while True:
+        # Numbers with few bits set make the best candidates
+        magic = (random_numbers.getrandbits(64)
+                 & random_numbers.getrandbits(64)
+                 & random_numbers.getrandbits(64))
+        # Quickly reject numbers that would not spread the mask
+        # across the top bits of the index
+        if bin((mask * magic) & 0xFF00000000000000).count("1") < 6:
+            continue
+
+        attempt += 1
+        for blockers, attacks in zip(blockers_list, attacks_list):
+            index = ((blockers * magic) & FULL_BOARD) >> shift
+            if filled_by[index] != attempt:
+                filled_by[index] = attempt
+                table[index] = attacks
+            elif table[index] != attacks:
+                # Collision - try another number
+                break
+        else:
+            # The unused entries are never looked up
+            return (magic, table)
+
+
+def generate_magics():
+    """
+    Find the magic numbers for both Rooks and Bishops
+    """
+
+    random_numbers = random.Random(MAGICS_SEED)
+    magics = {"version": MAGICS_FILE_VERSION}
+    for name, masks, shifts, directions in (
+            ("rook", ROOK_MASKS, ROOK_SHIFTS, ROOK_DIRECTIONS),
+            ("bishop", BISHOP_MASKS, BISHOP_SHIFTS, BISHOP_DIRECTIONS)):
+        found = [find_magic(bit, masks[bit], shifts[bit],
+                            directions, random_numbers)
+                 for bit in range(64)]
+        magics[name] = {"magics": [magic for (magic, table) in found],
+                        "tables": [table for (magic, table) in found]}
+
+    return magics
+
+
+def is_valid_magics(magics):
+    """
+    Check that the contents of the saved file are usable
+    """
+
+    if (not isinstance(magics, dict)
+       or magics.get("version") != MAGICS_FILE_VERSION):
+        return False
+
+    for name, shifts in (("rook", ROOK_SHIFTS), ("bishop", BISHOP_SHIFTS)):
+        entry = magics.get(name)
+        if (not isinstance(entry, dict)
+           or len(entry.get("magics", [])) != 64
+           or len(entry.get("tables", [])) != 64):
+            return False
+        for bit in range(64):
+            if len(entry["tables"][bit]) != 1 << (64 - shifts[bit]):
+                return False
+
+    return True
+
+
+def load_magics():
+    """
+    Read the magic numbers and their tables from MAGICS_FILE_NAME
+    If the file is missing or unusable, generate them afresh
+    and save them for next time
+    """
+
+    try:
+        with open(MAGICS_FILE_NAME, "r") as magics_file:
+            magics = json.load(magics_file)
+        if is_valid_magics(magics):
+            return magics
+    except (OSError, ValueError):
+        pass
+
+    print("Preparing the magic bitboard tables - this is only done once")
+    magics = generate_magics()
+    try:
+        with open(MAGICS_FILE_NAME, "w") as magics_file:
+            json.dump(magics, magics_file)
+    except OSError:
+        # Not being able to save the file is not fatal
+        pass
+
+    return magics
+
+
+# Set by 'prepare_magics'
+ROOK_MAGICS = None
+ROOK_TABLES = None
+BISHOP_MAGICS = None
+BISHOP_TABLES = None
+
+
+def prepare_magics():
+    """
+    Load (or generate) the magic numbers and their tables
+    """
+
+    global ROOK_MAGICS, ROOK_TABLES, BISHOP_MAGICS, BISHOP_TABLES
+    magics = load_magics()
+    ROOK_MAGICS = magics["rook"]["magics"]
+    ROOK_TABLES = magics["rook"]["tables"]
+    BISHOP_MAGICS = magics["bishop"]["magics"]
+    BISHOP_TABLES = magics["bishop"]["tables"]
+
+
+def rook_attacks(bit, occupied):
+    """
+    The squares attacked by a Rook on 'bit'
+    """
+    return ROOK_TABLES[bit][((occupied & ROOK_MASKS[bit]) * ROOK_MAGICS[bit]
+                             & FULL_BOARD) >> ROOK_SHIFTS[bit]]
+
+
+def bishop_attacks(bit, occupied):
+    """
+    The squares attacked by a Bishop on 'bit'
+    """
+    return BISHOP_TABLES[bit][((occupied & BISHOP_MASKS[bit])
+                               * BISHOP_MAGICS[bit]
+                               & FULL_BOARD) >> BISHOP_SHIFTS[bit]]
+
+
+def moves_of(bit, targets, opponent, flags=constants.QUIET_MOVE):
+    """
+    Convert a bitboard of the squares that the piece on 'bit' can move to
+    into a list of packed moves - see encoding.py
+    Moves onto an opponent piece are flagged as captures
+    """
+
+    moves_list = []
+    while targets:
+        lowest = targets & -targets
+        move = bit | ((lowest.bit_length() - 1) << 6) | flags
+        if lowest & opponent:
+            move |= constants.CAPTURE
+        moves_list.append(move)
+        targets ^= lowest
+
+    return moves_list
+
+
+# The ranks on which a Pawn is promoted
+PROMOTION_RANKS = 0xFF000000000000FF
+
+
+def movelist(chess, from_square):
+    """
+    Generate a list of possible moves for the piece on 'from_square'
+    Like the mailbox routines, the legality of the moves is checked later
+    """
+
+    the_piece = chess.board[from_square]
+    if the_piece is None:
+        return []  # blank square
+
+    if ROOK_TABLES is None:
+        # The first time that this move generator is used
+        prepare_magics()
+
+    piece_sign = the_piece.sign
+    letter = chess.letters[from_square]
+    bit = constants.SQUARE64[from_square]
+    own = chess.colour_bitboards[piece_sign]
+    opponent = chess.colour_bitboards[-piece_sign]
+    occupied = own | opponent
+
+    if letter == constants.KNIGHT_LETTER:
+        targets = KNIGHT_ATTACKS[bit] & ~own
+
+    elif letter == constants.BISHOP_LETTER:
+        targets = bishop_attacks(bit, occupied) & ~own
+
+    elif letter == constants.ROOK_LETTER:
+        targets = rook_attacks(bit, occupied) & ~own
+
+    elif letter == constants.QUEEN_LETTER:
+        targets = ((bishop_attacks(bit, occupied)
+                    | rook_attacks(bit, occupied)) & ~own)
+
+    elif letter == constants.KING_LETTER:
+        targets = KING_ATTACKS[bit] & ~own
+
+    else:
+        # Pawn: captures, one step forward
+        # and two steps forward from the starting rank
+        # provided that both squares in front of the Pawn are blank
+        # A Pawn reaching the board edge may be promoted to
+        # a Queen, Knight, Rook or Bishop - one move for each
+        targets = ((PAWN_ATTACKS[piece_sign][bit] & opponent)
+                   | (PAWN_PUSHES[piece_sign][bit] & ~occupied))
+        if targets & PROMOTION_RANKS:
+            all_the_moves = []
+            for flags in constants.PROMOTION_FLAGS:
+                all_the_moves += moves_of(bit, targets, opponent, flags)
+            return all_the_moves
+
+        if PAWN_PUSHES[piece_sign][bit] & occupied:
+            # Blocked - so the Pawn cannot move two steps forward either
+            return moves_of(bit, targets, opponent)
+
+        return (moves_of(bit, targets, opponent)
+                + moves_of(bit,
+                           PAWN_DOUBLE_PUSHES[piece_sign][bit] & ~occupied,
+                           opponent, constants.DOUBLE_PAWN_PUSH))
+
+    return moves_of(bit, targets, opponent)
+
+
+def is_square_attacked(chess, target_square, user_sign, ignore_square=None):
+    """
+    As extras.is_square_attacked, but look up the squares that attack
+    'target_square' rather than walk outwards from it
+    A piece attacks the target if a piece of the same kind
+    on the target would attack it
+    """
+
+    if ROOK_TABLES is None:
+        # The first time that this move generator is used
+        prepare_magics()
+
+    bit = constants.SQUARE64[target_square]
+    pieces = chess.piece_bitboards
+    opponent = chess.colour_bitboards[-user_sign]
+    occupied = opponent | chess.colour_bitboards[user_sign]
+    if ignore_square is not None:
+        occupied &= ~constants.SQUARE_BIT[ignore_square]
+
+    queens = pieces[constants.QUEEN_LETTER]
+    return bool(opponent
+                & ((KNIGHT_ATTACKS[bit] & pieces[constants.KNIGHT_LETTER])
+                   # An opposition Pawn attacks the square from the squares
+                   # that a Pawn of the User's colour would capture on
+                   | (PAWN_ATTACKS[user_sign][bit]
+                      & pieces[constants.PAWN_LETTER])
+                   | (KING_ATTACKS[bit] & pieces[constants.KING_LETTER])
+                   | (rook_attacks(bit, occupied)
+                      & (pieces[constants.ROOK_LETTER] | queens))
+                   | (bishop_attacks(bit, occupied)
+                      & (pieces[constants.BISHOP_LETTER] | queens))))
@@ -0,0 +1,182 @@
+"""
+compare_movegen.py
+Compare the two move generators
+
+constants.MOVE_GENERATOR selects either the mailbox move generator
+or the bitboard one - see extras.movelist
+Both must generate the same moves in every position
+So replay the games of the test PGN files and, in each position
+reached, compare the moves that each generator produces
+
+Run from the command line:
+    python3 run.py --compare-movegen            the games in testdata/*.pgn
+    python3 run.py --compare-movegen game.pgn   the games of other files
+"""
+
+import glob
+import re
+
+import constants
+import encoding
+import extras as e
+from game import Game
+
+
+# The test games
+DEFAULT_PGN_FILES = "testdata/*.pgn"
+
+# A move in SAN e.g. "Nbd7", "exd6", "bxc8=Q", "e8Q"
+# or in long notation e.g. "Ng1f3", "e7e5", "a7a5=Q"
+PGN_MOVE_PATTERN = re.compile(
+    r"([KQRBN]?)([a-h]?)([1-8]?)x?([a-h][1-8])(=?[QRBN]?)")
+
+# Castling given with either letter O or zero
+PGN_CASTLING_PATTERN = re.compile(r"([O0])-\1(-\1)?")
+
+
+def pgn_move_tokens(text):
+    """
+    The moves of a PGN game, as a list of strings
+    Comments, variations, move numbers, annotations and the result
+    are left out
+    """
+
+    text = re.sub(r"\{[^}]*\}", " ", text)
+    text = re.sub(r";[^\n]*", " ", text)
+    text = re.sub(r"\([^)]*\)", " ", text)
+    text = text.replace("e.p.", " ")
+
+    tokens = []
+    for token in text.split():
+        if token in ("1-0", "0-1", "1/2-1/2", "*"):
+            continue
+        # e.g. "1.e4", "1...", "12" or "Bxf7+", "Nh6!!", "bxc8=#"
+        token = re.sub(r"^\d+\.+", "", token)
+        token = token.rstrip("+#!?")
+        if token and not token.isdigit() and not token.startswith("$"):
+            tokens.append(token)
+    return tokens
+
+
+def find_pgn_move(chess, token, piece_sign):
+    """
+    The legal move that 'token' describes
+    None if there is no such move or more than one
+    """
+
+    castling = PGN_CASTLING_PATTERN.fullmatch(token)
+    parsed = PGN_MOVE_PATTERN.fullmatch(token)
+    if not castling and not parsed:
+        return None
+
+    found = []
+    for move in e.legal_movelist(chess, piece_sign):
+        flags = encoding.flags_of(move)
+        if castling:
+            wanted = (constants.QUEENSIDE_CASTLE if castling.group(2)
+                      else constants.KINGSIDE_CASTLE)
+            if flags == wanted:
+                found.append(move)
+            continue
+
+        (letter, from_file, from_rank, to_name, promotion) = parsed.groups()
+        text = encoding.move_text(move)
+        from_square = encoding.from_square_of(move)
+        if (text[2:4] != to_name
+           or chess.letters[from_square] != (letter or constants.PAWN_LETTER)
+           or from_file and text[0] != from_file
+           or from_rank and text[1] != from_rank):
+            continue
+        # A promotion without a piece letter e.g. "bxc8=" is to a Queen
+        promotion_letter = (promotion.lstrip("=")
+                            or (constants.QUEEN_LETTER if promotion
+                                else None))
+        if encoding.promotion_letter_of(move) != promotion_letter:
+            continue
+        found.append(move)
+
+    return found[0] if len(found) == 1 else None
+
+
+def generated_moves(chess, piece_sign, generator):
+    """
+    The pseudo-legal moves of each piece of the side to move
+    and the legal moves of the side, as generated by 'generator'
+    """
+
+    saved_generator = constants.MOVE_GENERATOR
+    constants.MOVE_GENERATOR = generator
+    try:
+        pieces = {from_square:
+                  sorted(e.movelist(chess, from_square, piece_sign))
+                  for from_square in chess.piece_squares(piece_sign)}
+        return (pieces, sorted(e.legal_movelist(chess, piece_sign)))
+    finally:
+        constants.MOVE_GENERATOR = saved_generator
+
+
+def compare_pgn_game(name, text):
+    """
+    Replay one PGN game and compare the move generators
+    in each of its positions
+    The replay stops at a move that is not legal,
+    as some of the test games have them on purpose
+    Return the number of positions compared and the number that differ
+    """
+
+    chess = Game()
+    piece_sign = constants.PLAYER
+    compared = 0
+    differences = 0
+    for token in pgn_move_tokens(text) + [None]:
+        compared += 1
+        mailbox = generated_moves(chess, piece_sign,
+                                  constants.MAILBOX_GENERATOR)
+        bitboard = generated_moves(chess, piece_sign,
+                                   constants.BITBOARD_GENERATOR)
+        if mailbox != bitboard:
+            differences += 1
+            print(f"    {name}: different moves before {token!r}")
+
+        if token is None:
+            break
+        move = find_pgn_move(chess, token, piece_sign)
+        if move is None:
+            print(f"    {name}: stopped at {token!r} which is not legal")
+            break
+
+        # The move stands, so its undo record is not kept
+        chess.make_move(move)
+        chess.keep_move()
+        piece_sign = -piece_sign
+
+    return (compared, differences)
+
+
+def compare_move_generators(pgn_paths=None):
+    """
+    The '--compare-movegen' mode of run.py
+    Compare the mailbox and bitboard move generators over PGN games,
+    by default the test games
+    Return True if they always agree
+    """
+
+    if not pgn_paths:
+        pgn_paths = sorted(glob.glob(DEFAULT_PGN_FILES))
+
+    total_compared = 0
+    total_differences = 0
+    for path in pgn_paths:
+        with open(path) as pgn_file:
+            text = pgn_file.read()
+        (compared, differences) = compare_pgn_game(path, text)
+        print(f"{path:<24} positions {compared:>5}  "
+              f"differences {differences}")
+        total_compared += compared
+        total_differences += differences
+
+    print(f"{'Total':<24} positions {total_compared:>5}  "
+          f"differences {total_differences}")
+    print("The move generators agree" if total_differences == 0
+          else "THE MOVE GENERATORS DIFFER")
+    return total_differences == 0
@@ -6,8 +6,23 @@ Various Constants used throughout the program
 import re
 
 # maximum recursive calls for the function evaluate()
-# 5 normal play; 3 dumber and quicker
-MAXLEVEL = 5
+# i.e. the deepest that iterative deepening searches - see run.think
+# The search budget below normally stops the search well before this
+MAXLEVEL = 20
+
+# The Computer's search budget for each move
+# The search stops when either runs out; None for no limit
+# With neither, every move is searched to MAXLEVEL
+SEARCH_TIME_SECONDS = 5.0
+SEARCH_NODE_BUDGET = None
+# How many processes search at once - see parallel.py
+SEARCH_THREADS = 1
+# How they share out the search
+LAZY_SMP = "lazy"
+ROOT_SPLIT = "root"
+PARALLEL_SEARCH = LAZY_SMP
+# Whether the Computer thinks whilst the Player thinks - see ponder.py
+PONDERING = True
 
 # Negative number used to represent Black
 COMPUTER = -1
@@ -39,9 +54,48 @@ STR_TOTAL = 7
 LINESIZE = 80 - 7
 FILE_SIZE_LIMIT = 10000
 EVALUATE_THRESHOLD_SCORE = 10000
+# Beyond any score that 'evaluate' can return
+# The widest Alpha-Beta window is -INFINITE_SCORE to INFINITE_SCORE
+INFINITE_SCORE = 100000
+# Quiescence Search - see run.quiesce
+# A capture is skipped if the value of the piece taken plus this margin
+# cannot raise the score to alpha
+QUIESCENCE_DELTA_MARGIN = 200
+
+"""
+Null Move Pruning and Late Move Reductions - see run.evaluate
+Either can be switched off, e.g. to compare the search with and without it
+"""
+
+NULL_MOVE_PRUNING = True
+# How many moves less deeply the null move is evaluated (R)
+NULL_MOVE_REDUCTION = 2
+LATE_MOVE_REDUCTIONS = True
+# How many moves less deeply a late move is evaluated
+LMR_REDUCTION = 1
+# The moves tried before this many are never reduced
+LMR_FULL_DEPTH_MOVES = 4
+# The moves tried from this many on are reduced by one move more
+LMR_LATER_MOVES = 12
+# Positions evaluated less deeply than this have no moves reduced
+LMR_MIN_DEPTH = 3
+
+# Aspiration Windows - see run.aspiration_search
+ASPIRATION_WINDOWS = True
+# The first window is the previous depth's score plus or minus this
+ASPIRATION_DELTA = 25
+# Each time the score falls outside the window, the window is widened
+# by ASPIRATION_DELTA times this, then times this again ...
+ASPIRATION_WIDENING = 2
+# Shallower depths are always searched with the widest window
+ASPIRATION_MIN_DEPTH = 3
 # If the 'evaluate' functions computes a score less than this value,
 # then the Computer will resign
-STALEMATE_THRESHOLD_SCORE = -2500
+# Only the mate score is below this: 'evaluate' returns
+# -EVALUATE_THRESHOLD_SCORE when a side is mated, or has no move at all
+# at the top level, whereas a score made up of material and piece-square
+# bonuses (see piece_square.py) never gets this low
+STALEMATE_THRESHOLD_SCORE = -EVALUATE_THRESHOLD_SCORE + 1
 
 DESTINATION_SQUARE_ONLY = 1  # EG e4 OR Ne2
 PAWN_CAPTURE_FILE = 2  # EG exd4
@@ -124,10 +178,316 @@ PRESET_CHESSBOARD = [chr(j+97) + chr(k+49)
                      for j in range(8)
                      for k in range(8)]
 
+"""
+The 10x12 Mailbox
+The chessboard is held as a list of 120 entries, that is,
+the 64 squares surrounded by a border two squares deep at the top
+and bottom and one square deep at either side
+
+    a1 is 21, h1 is 28
+    a8 is 91, h8 is 98
+
+So moving one file to the right is +1 and moving one rank up is +10
+Any step that falls off the edge of the board lands on a border square
+Therefore, no arithmetic is needed to test whether a square is on the board
+
+The square names e.g. "e4" are only used at the I/O edge of the program
+SQUARE_INDEX converts "e4" into 55
+SQUARE_NAME converts 55 back into "e4"
+"""
+
+MAILBOX_SIZE = 120
+# The 'sign' of a border square - neither PLAYER, COMPUTER nor BLANK
+OFF_BOARD = 2
+
+SQUARE_INDEX = {chr(j+97) + chr(k+49): 21 + j + 10 * k
+                for j in range(8)
+                for k in range(8)}
+
+SQUARE_NAME = [None] * MAILBOX_SIZE
+for name in PRESET_CHESSBOARD:
+    SQUARE_NAME[SQUARE_INDEX[name]] = name
+
+# Every square of the board in the same order as PRESET_CHESSBOARD
+BOARD_SQUARES = [SQUARE_INDEX[name] for name in PRESET_CHESSBOARD]
+
+# The position of each square within BOARD_SQUARES
+# Game keeps each side's piece list in this order
+BOARD_ORDER = [None] * MAILBOX_SIZE
+for order, square in enumerate(BOARD_SQUARES):
+    BOARD_ORDER[square] = order
+
+# The row of the mailbox that holds rank 1 and rank 8 respectively
+# i.e. square // 10
+FIRST_RANK_ROW = 2
+EIGHTH_RANK_ROW = 9
+
+"""
+Precomputed destination squares
+For every mailbox index, the squares that a Knight, a King or a Pawn
+on that square could move to are worked out once here at import time
+Squares that would fall off the board are left out
+So the move generators only need to test the occupancy of each target
+Border squares have an empty list
+"""
+
+# In the order that the moves are generated
+KNIGHT_OFFSETS = [
+    -21,  # down 2, left 1
+    19,   # up 2, left 1
+    -12,  # down 1, left 2
+    8,    # up 1, left 2
+    -19,  # down 2, right 1
+    21,   # up 2, right 1
+    -8,   # down 1, right 2
+    12,   # up 1, right 2
+]
+
+KING_OFFSETS = [
+    10,    # up
+    -10,   # down
+    -1,    # left
+    1,     # right
+    9,     # diagonal up-left
+    11,    # diagonal up-right
+    -11,   # diagonal down-left
+    -9,    # diagonal down-right
+]
+
+# A Pawn captures diagonally forwards, left then right
+PAWN_CAPTURE_OFFSETS = {PLAYER: [9, 11], COMPUTER: [-11, -9]}
+
+
+def build_targets(offsets):
+    """
+    For each mailbox index list the squares reached by 'offsets'
+    that are on the board
+    """
+
+    return [[square + offset for offset in offsets
+             if SQUARE_NAME[square + offset] is not None]
+            if SQUARE_NAME[square] is not None else []
+            for square in range(MAILBOX_SIZE)]
+
+
+KNIGHT_TARGETS = build_targets(KNIGHT_OFFSETS)
+KING_TARGETS = build_targets(KING_OFFSETS)
+PAWN_CAPTURE_TARGETS = {sign: build_targets(offsets)
+                        for sign, offsets in PAWN_CAPTURE_OFFSETS.items()}
+
+"""
+Precomputed rays for the sliding pieces
+For every mailbox index and direction, the ray is the list of squares
+from (but not including) that square up to the edge of the board
+Rook, Bishop and Queen each have a list of rays per square,
+in the order that their moves are generated
+"""
+
+# left, right, down, up
+ROOK_DIRECTIONS = [-1, 1, -10, 10]
+# bottom-left, top-left, bottom-right, top-right
+BISHOP_DIRECTIONS = [-11, 9, -9, 11]
+
+
+def build_rays(directions):
+    """
+    For each mailbox index list the ray in each of the 'directions'
+    """
+
+    all_the_rays = []
+    for square in range(MAILBOX_SIZE):
+        rays = []
+        if SQUARE_NAME[square] is not None:
+            for step in directions:
+                ray = []
+                target = square + step
+                while SQUARE_NAME[target] is not None:
+                    ray.append(target)
+                    target += step
+                rays.append(ray)
+        all_the_rays.append(rays)
+
+    return all_the_rays
+
+
+ROOK_RAYS = build_rays(ROOK_DIRECTIONS)
+BISHOP_RAYS = build_rays(BISHOP_DIRECTIONS)
+# The Queen moves diagonally first, then horizontally and vertically
+QUEEN_RAYS = [BISHOP_RAYS[square] + ROOK_RAYS[square]
+              for square in range(MAILBOX_SIZE)]
+
+"""
+Bitboards
+Each of the 64 squares is also given a bit number from 0 (a1) to 63 (h8)
+That is, bit number = file + 8 * rank, counting both from zero
+SQUARE64 converts a mailbox index into its bit number (-1 for the border)
+SQUARE120 converts a bit number back into its mailbox index
+SQUARE_BIT holds the bit itself i.e. 1 << bit number (0 for the border)
+"""
+
+SQUARE120 = [21 + (bit % 8) + 10 * (bit // 8) for bit in range(64)]
+
+SQUARE64 = [-1] * MAILBOX_SIZE
+for bit in range(64):
+    SQUARE64[SQUARE120[bit]] = bit
+
+SQUARE_BIT = [0 if bit < 0 else 1 << bit for bit in SQUARE64]
+
+"""
+Packed Moves
+Throughout the engine a chess move is held as a single integer
+of 16 bits, see encoding.py
+
+    bits  0 to  5  the bit number of the 'from' square
+    bits  6 to 11  the bit number of the 'to' square
+    bits 12 to 15  the flags below
+
+The flags are given already shifted into place, so a move is
+from | to << 6 | flags
+A flag of 8 or more is a promotion; its lowest two bits give the piece
+Every capture has the CAPTURE bit set
+"""
+
+MOVE_SQUARE_MASK = 63
+MOVE_FLAGS_MASK = 15 << 12
+# Both squares together i.e. the move without its flags
+MOVE_FROM_TO_MASK = 4095
+
+QUIET_MOVE = 0
+DOUBLE_PAWN_PUSH = 1 << 12
+KINGSIDE_CASTLE = 2 << 12
+QUEENSIDE_CASTLE = 3 << 12
+CAPTURE = 4 << 12
+EN_PASSANT_CAPTURE = 5 << 12
+PROMOTION = 8 << 12
+KNIGHT_PROMOTION = 8 << 12
+BISHOP_PROMOTION = 9 << 12
+ROOK_PROMOTION = 10 << 12
+QUEEN_PROMOTION = 11 << 12
+
+# The moves that are made by their own routines during the game
+# i.e. not by simply moving one piece from one square to another
+SPECIAL_MOVE_FLAGS = (KINGSIDE_CASTLE, QUEENSIDE_CASTLE, EN_PASSANT_CAPTURE)
+
+# The promotions of a Pawn in the order in which they are generated
+PROMOTION_FLAGS = [QUEEN_PROMOTION, KNIGHT_PROMOTION,
+                   ROOK_PROMOTION, BISHOP_PROMOTION]
+
+# Indexed by the lowest two bits of a promotion's flags
+PROMOTION_LETTERS = [KNIGHT_LETTER, BISHOP_LETTER, ROOK_LETTER, QUEEN_LETTER]
+PROMOTION_VALUES = {KNIGHT_LETTER: KNIGHT_VALUE,
+                    BISHOP_LETTER: BISHOP_VALUE,
+                    ROOK_LETTER: ROOK_VALUE,
+                    QUEEN_LETTER: QUEEN_VALUE}
+
+# No move at all - a1 to a1
+NO_MOVE = 0
+
+# The 'to' part of a move for each mailbox index
+MOVE_TO_BITS = [bit << 6 if bit >= 0 else 0 for bit in SQUARE64]
+
+"""
+Castling Rights
+Each side may castle kingside and queenside
+These four rights are held as bits of one number
+A right is lost as soon as its King or Rook leaves (or is taken on)
+its starting square. CASTLING_RIGHTS_MASK holds, for every mailbox index,
+the rights that remain when a piece moves from or to that square
+"""
+
+PLAYER_KINGSIDE_RIGHT = 1
+PLAYER_QUEENSIDE_RIGHT = 2
+COMPUTER_KINGSIDE_RIGHT = 4
+COMPUTER_QUEENSIDE_RIGHT = 8
+ALL_CASTLING_RIGHTS = 15
+
+CASTLING_RIGHTS_MASK = [ALL_CASTLING_RIGHTS] * MAILBOX_SIZE
+for name, lost in (("e1", PLAYER_KINGSIDE_RIGHT | PLAYER_QUEENSIDE_RIGHT),
+                   ("h1", PLAYER_KINGSIDE_RIGHT),
+                   ("a1", PLAYER_QUEENSIDE_RIGHT),
+                   ("e8", COMPUTER_KINGSIDE_RIGHT | COMPUTER_QUEENSIDE_RIGHT),
+                   ("h8", COMPUTER_KINGSIDE_RIGHT),
+                   ("a8", COMPUTER_QUEENSIDE_RIGHT)):
+    CASTLING_RIGHTS_MASK[SQUARE_INDEX[name]] = ALL_CASTLING_RIGHTS ^ lost
+
+"""
+Castling Moves
+For each side: the right needed, the move's flag,
+the King's square and the square it castles to,
+the squares that must be blank and the squares that must not be attacked
+The King must not be in Check either
+"""
+
+CASTLING_MOVES = {}
+for sign, rank in ((PLAYER, "1"), (COMPUTER, "8")):
+    CASTLING_MOVES[sign] = [
+        (PLAYER_KINGSIDE_RIGHT if sign == PLAYER else COMPUTER_KINGSIDE_RIGHT,
+         KINGSIDE_CASTLE,
+         SQUARE_INDEX["e" + rank], SQUARE_INDEX["g" + rank],
+         [SQUARE_INDEX["f" + rank], SQUARE_INDEX["g" + rank]],
+         [SQUARE_INDEX["f" + rank], SQUARE_INDEX["g" + rank]]),
+        (PLAYER_QUEENSIDE_RIGHT if sign == PLAYER
+         else COMPUTER_QUEENSIDE_RIGHT,
+         QUEENSIDE_CASTLE,
+         SQUARE_INDEX["e" + rank], SQUARE_INDEX["c" + rank],
+         [SQUARE_INDEX["d" + rank], SQUARE_INDEX["c" + rank],
+          SQUARE_INDEX["b" + rank]],
+         [SQUARE_INDEX["d" + rank], SQUARE_INDEX["c" + rank]])]
+
+# Where the Rook moves from and to, given the square the King castles to
+CASTLING_ROOK_SQUARES = {}
+for rank in ("1", "8"):
+    CASTLING_ROOK_SQUARES[SQUARE_INDEX["g" + rank]] = (
+        SQUARE_INDEX["h" + rank], SQUARE_INDEX["f" + rank])
+    CASTLING_ROOK_SQUARES[SQUARE_INDEX["c" + rank]] = (
+        SQUARE_INDEX["a" + rank], SQUARE_INDEX["d" + rank])
+
+# The most moves that can be made (and not yet unmade) at any one time
+# i.e. the size of the stack of undo records - see Game.make_move
+MAX_PLY = 128
+
+"""
+The Transposition Table - see transposition.py
+The most memory (in megabytes) that the table may take
+and the kinds of score that an entry may hold
+"""
+
+TRANSPOSITION_TABLE_MB = 16
+# The score is the position's score
+EXACT_BOUND = 0
+# The evaluation was cut short; the score is at least this
+LOWER_BOUND = 1
+# The evaluation was cut short; the score is at most this
+UPPER_BOUND = 2
+
+"""
+Move Ordering - see ordering.py
+The rank of each kind of piece when captures are put in order
+Most Valuable Victim first then Least Valuable Attacker first
+Kept small so that a capture's rank is victim * 8 - attacker
+"""
+
+PIECE_ORDER_RANKS = {PAWN_LETTER: 1, KNIGHT_LETTER: 2, BISHOP_LETTER: 3,
+                     ROOK_LETTER: 4, QUEEN_LETTER: 5, KING_LETTER: 6}
+
+# How many killer moves are kept for each level of 'evaluate'
+KILLER_SLOTS = 2
+# The history scores are divided by this before each of the Computer's moves
+HISTORY_AGEING_DIVISOR = 2
+
+# Which routines 'extras.movelist' uses to generate the moves of a piece
+# Either the mailbox routines in extras.py or the bitboards in bitboards.py
+# Both generate exactly the same moves
+MAILBOX_GENERATOR = "mailbox"
+BITBOARD_GENERATOR = "bitboard"
+MOVE_GENERATOR = MAILBOX_GENERATOR
+
 # FILE I/O
 
 INPUT_PGN_NAME = "input.pgn"
 OUTPUT_PGN_NAME = "output.pgn"
+# Where bitboards.py saves its magic numbers
+MAGICS_FILE_NAME = "magics.json"
 
 # Pauses
 # Pause 2 seconds
@@ -0,0 +1,90 @@
+"""
+encoding.py
+Packed Moves
+
+The engine passes chess moves around as single integers
+rather than as strings or tuples of strings such as ("e", "2", "e", "4")
+See constants.py for the layout of the 16 bits
+Only when a move is displayed or written out is it turned back into text
+"""
+
+import constants
+
+
+def encode_move(from_square, to_square, flags=constants.QUIET_MOVE):
+    """
+    Pack a move from 'from_square' to 'to_square' (mailbox indices)
+    """
+
+    return (constants.SQUARE64[from_square]
+            | constants.MOVE_TO_BITS[to_square]
+            | flags)
+
+
+def from_square_of(move):
+    """
+    The mailbox index of the square that the piece moves from
+    """
+    return constants.SQUARE120[move & constants.MOVE_SQUARE_MASK]
+
+
+def to_square_of(move):
+    """
+    The mailbox index of the square that the piece moves to
+    """
+    return constants.SQUARE120[(move >> 6) & constants.MOVE_SQUARE_MASK]
+
+
+def flags_of(move):
+    """
+    The flags of the move, still shifted into place
+    """
+    return move & constants.MOVE_FLAGS_MASK
+
+
+def is_capture(move):
+    """
+    Does the move take a piece?
+    """
+    return bool(move & constants.CAPTURE)
+
+
+def promotion_letter_of(move):
+    """
+    The letter of the piece that a Pawn is promoted to
+    None if the move is not a promotion
+    """
+
+    if not move & constants.PROMOTION:
+        return None
+
+    return constants.PROMOTION_LETTERS[(move >> 12) & 3]
+
+
+def move_names(move):
+    """
+    Unpack the move into the from file, from rank, to file and to rank
+    e.g. ("e", "2", "e", "4")
+    as used by the routines that display and output chess moves
+    NO_MOVE unpacks into empty strings
+    """
+
+    if move == constants.NO_MOVE:
+        return ("", "", "", "")
+
+    from_name = constants.SQUARE_NAME[from_square_of(move)]
+    to_name = constants.SQUARE_NAME[to_square_of(move)]
+    return (from_name[0], from_name[1], to_name[0], to_name[1])
+
+
+def move_text(move):
+    """
+    The move in long notation e.g. "e2e4" or "e7e8q"
+    """
+
+    text = (constants.SQUARE_NAME[from_square_of(move)]
+            + constants.SQUARE_NAME[to_square_of(move)])
+    letter = promotion_letter_of(move)
+    if letter:
+        text += letter.lower()
+    return text
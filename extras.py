@@ -14,6 +14,7 @@ from game import Game
 import moves as m
 from time import sleep
 import fileio as f
+import bitboards
 
 
 class CustomException(Exception):
@@ -26,395 +27,193 @@ class CustomException(Exception):
     pass
 
 
-""" ROUTINES THAT GENERATE EACH OF THE PIECE'S MOVES """
-
-
-def advance_vertical(rank, steps):
-    """
-    Calculate the new rank
-    by adding 'steps' to the current 'rank'
-    (8 at the top, 1 at the bottom)
-    If the sum is not within the range 1 - 8
-    then return None
-    """
-
-    newrank = chr(ord(rank) + steps)
-    return newrank if "1" <= newrank <= "8" else None
-
-
-def advance_horizontal(file, steps):
-    """
-    Calculate the new file
-    by adding 'steps' to the current 'file'
-    ('a' to the far left, 'h' to the far right)
-    If the sum is not within the range a - h
-    then return None
+class SearchBudgetExhausted(Exception):
     """
-
-    newfile = chr(ord(file) + steps)
-    return newfile if "a" <= newfile <= "h" else None
-
-
-def check_horizontally(chess, file_start, limit, step, rank,
-                       moves_list, piece_sign):
+    Raised by 'evaluate' when the Computer's time or node budget
+    runs out part of the way through a search
+    Caught by 'think' which then plays the best move
+    of the last search that was completed
     """
-    Move either right to left OR left to right
-    For each blank square append the square's coordinates
-    When an opponent piece has been reached, append the square's coordinates
-    and return the list
-    When a piece of the same colour has been reached
-    or the edge of the board has been reached,
-    return the list
-    """
-
-    for m in range(file_start, limit, step):
-        newfile = chr(m + constants.ASCII_A_MINUS1)  # 96
-        square_sign = chess.piece_sign(newfile, rank)
-        if piece_sign != square_sign:
-            # Either an opponent piece or a blank square
-            moves_list.append(newfile + rank)
-
-        # Reached an occupied square - proceed no further
-        if square_sign != constants.BLANK:
-            return moves_list
+    pass
 
-    return moves_list
 
+""" ROUTINES THAT GENERATE EACH OF THE PIECE'S MOVES """
 
-def check_vertically(chess, rank_start, limit, step,
-                     file, moves_list, piece_sign):
-    """
-    Move either from top to bottom OR from bottom to top
-    For each blank square append the square's coordinates
-    When an opponent piece has been reached, append the square's coordinates
-    and return the list
-    When a piece of the same colour has been reached
-    or the edge of the board has been reached,
-    return the list
-    """
+"""
+The board is a 10x12 mailbox - see constants.py
+Therefore, each square is an integer and a step in any direction
+is simply an addition. For example, +1 moves one file to the right
+and +10 moves one rank up.
+Stepping off the edge of the board lands on a border square
+whose sign is constants.OFF_BOARD
+"""
 
-    for m in range(rank_start, limit, step):
-        newrank = chr(m + constants.ASCII_ZERO)  # 48
-        square_sign = chess.piece_sign(file, newrank)
-        if piece_sign != square_sign:
-            # Either an opponent piece or a blank square
-            moves_list.append(file + newrank)
 
-        # Reached an occupied square - proceed no further
-        if square_sign != constants.BLANK:
-            return moves_list
+def generate_slider_moves(chess, square, rays, moves_list, piece_sign):
+    """
+    Generate the moves of a Rook, Bishop or Queen
+    'rays' are the precomputed rays of its square - see constants.py
+    Walk along each ray
+    For each blank square append the move
+    When an opponent piece has been reached, append the capture
+    and move on to the next ray
+    When a piece of the same colour has been reached,
+    move on to the next ray
+    """
+
+    board = chess.board
+    # The moves are packed integers - see encoding.py
+    origin = constants.SQUARE64[square]
+    to_bits = constants.MOVE_TO_BITS
+    for ray in rays:
+        for target in ray:
+            occupant = board[target]
+            if occupant is None:
+                # Blank square
+                moves_list.append(origin | to_bits[target])
+                continue
+
+            if occupant.sign == -piece_sign:
+                # Opponent piece
+                moves_list.append(origin | to_bits[target]
+                                  | constants.CAPTURE)
+
+            # Reached an occupied square - proceed no further
+            break
 
     return moves_list
 
 
-def horizontal_vertical(chess, file, rank, moves_list, piece_sign):
+def generate_step_moves(chess, square, targets, moves_list, piece_sign):
     """
-    Record blank squares or an opponent's square
-    whilst scanning both horizontally and vertically
+    Generate the moves of a Knight or King
+    'targets' are the precomputed destination squares of its square
+    Each must be either blank or an opponent piece
     """
 
-    # Convert 'file' i.e. 'a' to 'h' to a number between 1 to 8
-    base_file_number = ord(file) - constants.ASCII_A_MINUS1  # 96
-
-    # Move from the current piece's position,
-    # towards the left until reaching a nonblank square
-    # or the edge of the board
-    moves_list = check_horizontally(chess, base_file_number - 1, 0, -1,
-                                    rank, moves_list, piece_sign)
-
-    # Move from the current piece's position,
-    # towards the right until reaching a nonblank square
-    # or the edge of the board
-    moves_list = check_horizontally(chess, base_file_number + 1, 9, 1,
-                                    rank, moves_list, piece_sign)
-
-    # Convert 'rank' i.e. '1' to '8' to a number between 1 to 8
-    base_rank_number = ord(rank) - constants.ASCII_ZERO  # 48
-
-    # Move from the current piece's position,
-    # towards the bottom until reaching a nonblank square
-    # or the edge of the board
-    moves_list = check_vertically(chess, base_rank_number - 1, 0, -1,
-                                  file, moves_list, piece_sign)
-
-    # Move from the current piece's position,
-    # towards the top until reaching a nonblank square
-    # or the edge of the board
-    moves_list = check_vertically(chess, base_rank_number + 1, 9, 1,
-                                  file, moves_list, piece_sign)
+    board = chess.board
+    origin = constants.SQUARE64[square]
+    to_bits = constants.MOVE_TO_BITS
+    for target in targets:
+        occupant = board[target]
+        if occupant is None:
+            moves_list.append(origin | to_bits[target])
+        elif occupant.sign == -piece_sign:
+            moves_list.append(origin | to_bits[target] | constants.CAPTURE)
 
     return moves_list
 
 
-def check_diagonally(chess, basefile, baserank,
-                     horizontal, vertical, piece_sign):
-    """
-    Move diagonally by one square
-    If the coordinates are off the board, return False
-    If a piece of the same colour has been reached return False
-    If the square is blank return the square's coordinates
-    If an opponent piece has been reached return the square's coordinates
-    """
-
-    newfile = chr(basefile + horizontal)
-    newrank = chr(baserank + vertical)
-    if not (("a" <= newfile <= "h") and ("1" <= newrank <= "8")):
-        return None
-
-    square_sign = chess.piece_sign(newfile, newrank)
-    if piece_sign == square_sign:
-        # Same colour piece
-        return None
-
-    # Either an opponent piece or a blank square
-    return newfile + newrank
-
-
-def diagonal(chess, file, rank, moves_list, piece_sign):
-    """
-    Record blank squares or an opponent's square
-    whilst scanning diagonally
-    """
-
-    # Convert 'file' i.e. 'a' to 'h' to its corresponding code
-    base_file_number = ord(file)
-    # Convert 'rank' i.e. '1' to '8' to its corresponding code
-    base_rank_number = ord(rank)
-
-    # Move from the current piece's position,
-    # diagonally bottom-left until reaching a nonblank square
-    # or the edge of the board
-    for m in range(1, 8):  # 1 to 7
-        result = check_diagonally(chess, base_file_number, base_rank_number,
-                                  -m, -m,
-                                  piece_sign)
-        if not result:
-            # proceed no further
-            break
-
-        # Otherwise add the square
-        moves_list.append(result)
-        # Reached an occupied square - proceed no further
-        if chess.piece_sign(result) != constants.BLANK:
-            break
-
-    # Move from the current piece's position,
-    # diagonally bottom-right until reaching a nonblank square
-    # or the edge of the board
-    for m in range(1, 8):  # 1 to 7
-        result = check_diagonally(chess, base_file_number, base_rank_number,
-                                  -m, m,
-                                  piece_sign)
-        if not result:
-            # proceed no further
-            break
-
-        # Otherwise add the square
-        moves_list.append(result)
-        # Reached an occupied square - proceed no further
-        if chess.piece_sign(result) != constants.BLANK:
-            break
-
-    # Move from the current piece's position,
-    # diagonally top-left until reaching a nonblank square
-    # or the edge of the board
-    for m in range(1, 8):  # 1 to 7
-        result = check_diagonally(chess, base_file_number, base_rank_number,
-                                  m, -m,
-                                  piece_sign)
-        if not result:
-            # proceed no further
-            break
-
-        # Otherwise add the square
-        moves_list.append(result)
-        # Reached an occupied square - proceed no further
-        if chess.piece_sign(result) != constants.BLANK:
-            break
-
-    # Move from the current piece's position,
-    # diagonally top-right until reaching a nonblank square
-    # or the edge of the board
-    for m in range(1, 8):  # 1 to 7
-        result = check_diagonally(chess, base_file_number, base_rank_number,
-                                  m, m,
-                                  piece_sign)
-        if not result:
-            # proceed no further
-            break
-
-        # Otherwise add the square
-        moves_list.append(result)
-        # Reached an occupied square - proceed no further
-        if chess.piece_sign(result) != constants.BLANK:
-            break
-
-    return moves_list
-
-
-def generate_moves_for_pawn(chess, file, rank,
-                            moves_list, piece_sign):
+def generate_moves_for_pawn(chess, square, moves_list, piece_sign):
     """
     Generate all the possible moves of the Pawn piece
     The legality of the moves are checked later
+    A Pawn reaching the board edge may be promoted to
+    a Queen, Knight, Rook or Bishop - one move for each
     """
 
-    rank_plus1 = advance_vertical(rank, piece_sign)
-    if not rank_plus1:
+    board = chess.board
+    origin = constants.SQUARE64[square]
+    to_bits = constants.MOVE_TO_BITS
+    # One rank forward is +10 for White and -10 for Black
+    square_plus1 = square + 10 * piece_sign
+    target = board[square_plus1]
+    if target is not None and target.sign == constants.OFF_BOARD:
         # Reached the edge of the board
         return moves_list
 
-    # Capture left?
-    newfile = advance_horizontal(file, -1)
-    # Is there an opponent piece present?
-    if newfile and chess.piece_sign(newfile, rank_plus1) == -piece_sign:
-        moves_list.append(newfile + rank_plus1)
+    # Will the Pawn reach the board edge?
+    row = square_plus1 // 10
+    if row == constants.FIRST_RANK_ROW or row == constants.EIGHTH_RANK_ROW:
+        promotions = constants.PROMOTION_FLAGS
+    else:
+        promotions = [constants.QUIET_MOVE]
 
-    # Capture right?
-    newfile = advance_horizontal(file, 1)
+    # Capture left? Capture right?
     # Is there an opponent piece present?
-    if newfile and chess.piece_sign(newfile, rank_plus1) == -piece_sign:
-        moves_list.append(newfile + rank_plus1)
+    for capture_square in constants.PAWN_CAPTURE_TARGETS[piece_sign][square]:
+        capture = board[capture_square]
+        if capture is not None and capture.sign == -piece_sign:
+            for promotion in promotions:
+                moves_list.append(origin | to_bits[capture_square]
+                                  | constants.CAPTURE | promotion)
 
     # one step forward
     # Is this square blank?
-    if chess.piece_sign(file, rank_plus1) == constants.BLANK:
-        moves_list.append(file + rank_plus1)
+    if target is not None:
+        # Blocked - so the Pawn cannot move two steps forward either
+        return moves_list
 
-    # two steps forward
-    if rank == "2" and piece_sign == constants.PLAYER:
-        rank_plus2 = advance_vertical(rank, 2)
-    elif rank == "7" and piece_sign == constants.COMPUTER:
-        rank_plus2 = advance_vertical(rank, -2)
-    else:
-        rank_plus2 = False
+    for promotion in promotions:
+        moves_list.append(origin | to_bits[square_plus1] | promotion)
 
-    if rank_plus2:
+    # two steps forward
+    # Only from the pawn's starting rank i.e. rank 2 or rank 7
+    row = square // 10
+    if ((row == constants.FIRST_RANK_ROW + 1
+         and piece_sign == constants.PLAYER)
+       or (row == constants.EIGHTH_RANK_ROW - 1
+           and piece_sign == constants.COMPUTER)):
+        square_plus2 = square_plus1 + 10 * piece_sign
         # Is this square blank?
-        if chess.piece_sign(file, rank_plus2) == constants.BLANK:
-            moves_list.append(file + rank_plus2)
+        if board[square_plus2] is None:
+            moves_list.append(origin | to_bits[square_plus2]
+                              | constants.DOUBLE_PAWN_PUSH)
 
     return moves_list
 
 
-def generate_moves_for_rook(chess, file, rank,
-                            moves_list, piece_sign):
+def generate_moves_for_rook(chess, square, moves_list, piece_sign):
     """
     Generate all the possible moves of the Rook piece
     The legality of the moves are checked later
     """
-    return horizontal_vertical(chess, file, rank, moves_list, piece_sign)
+    return generate_slider_moves(chess, square, constants.ROOK_RAYS[square],
+                                 moves_list, piece_sign)
 
 
-def examine_this_square(diffs_tuple, chess, file, rank, piece_sign):
-    """
-    Check if it is possible for the piece to land on this square
-    Calculate the square's coordinates using the numbers in 'diffs_tuple'
-    """
-
-    (file_diff, rank_diff) = diffs_tuple
-
-    # Is it on the board?
-    newfile = chr(ord(file) + file_diff)
-    if not ("a" <= newfile <= "h"):
-        return False
-
-    newrank = chr(ord(rank) + rank_diff)
-    if not ("1" <= newrank <= "8"):
-        return False
-
-    index = newfile + newrank
-    square_sign = chess.piece_sign(newfile, newrank)
-
-    # True: Either an opponent piece or a blank square
-    # False: Otherwise same coloured piece
-    return piece_sign != square_sign
-
-
-def add_knight_king_square(diffs_tuple, file, rank):
-    """
-    Having determined that it is possible
-    for a Knight piece or a King piece
-    to land on a particular square
-    Create the coordinates of this square using the numbers in 'diff_tuple'
-    e.g. (1, 2) means file += 1, rank += 2.
-    """
-
-    (file_diff, rank_diff) = diffs_tuple
-    newfile = chr(ord(file) + file_diff)
-    newrank = chr(ord(rank) + rank_diff)
-    return newfile + newrank
-
-
-def generate_moves_for_knight(chess, file, rank,
-                              moves_list, piece_sign):
+def generate_moves_for_knight(chess, square, moves_list, piece_sign):
     """
     Generate all the possible moves of the Knight piece
     The legality of the moves are checked later
     """
 
-    knight_moves = [
-        (-1, -2),  # down 1, left 2
-        (-1, 2),   # down 1, right 2
-        (-2, -1),  # down 2, left 1
-        (-2, 1),   # down 2, right 1
-        (1, -2),   # up 1, left 2
-        (1, 2),    # up 1, right 2
-        (2, -1),   # up 2, left 1
-        (2, 1),    # up 2, right 1
-    ]
+    # The destination squares are precomputed - see constants.py
+    return generate_step_moves(chess, square,
+                               constants.KNIGHT_TARGETS[square],
+                               moves_list, piece_sign)
 
-    moves_list += [add_knight_king_square(diffs, file, rank)
-                   for diffs in knight_moves
-                   if examine_this_square(diffs, chess,
-                                          file, rank, piece_sign)]
 
-    return moves_list
-
-
-def generate_moves_for_bishop(chess, file, rank,
-                              moves_list, piece_sign):
+def generate_moves_for_bishop(chess, square, moves_list, piece_sign):
     """
     Generate all the possible moves of the Bishop piece
     The legality of the moves are checked later
     """
-    return diagonal(chess, file, rank, moves_list, piece_sign)
+    return generate_slider_moves(chess, square,
+                                 constants.BISHOP_RAYS[square],
+                                 moves_list, piece_sign)
 
 
-def generate_moves_for_queen(chess, file, rank,
-                             moves_list, piece_sign):
+def generate_moves_for_queen(chess, square, moves_list, piece_sign):
     """
     Generate all the possible moves of the Queen piece
     The legality of the moves are checked later
     """
-    moves_list = diagonal(chess, file, rank, moves_list, piece_sign)
-    moves_list = horizontal_vertical(chess, file, rank, moves_list, piece_sign)
-    return moves_list
+    return generate_slider_moves(chess, square,
+                                 constants.QUEEN_RAYS[square],
+                                 moves_list, piece_sign)
 
 
-def generate_moves_for_king(chess, file, rank,
-                            moves_list, piece_sign):
+def generate_moves_for_king(chess, square, moves_list, piece_sign):
     """
     Generate all the possible moves of the King piece
     The legality of the moves are checked later
     """
 
-    king_moves = [
-        (0, 1),     # up
-        (0, -1),    # down
-        (-1, 0),    # left
-        (1, 0),     # right
-        (-1, 1),    # diagonal up-left
-        (1, 1),     # diagonal up-right
-        (-1, -1),   # diagonal down-left
-        (1, -1),    # diagonal down-right
-    ]
-
-    moves_list += [add_knight_king_square(diffs, file, rank)
-                   for diffs in king_moves
-                   if examine_this_square(diffs, chess,
-                                          file, rank, piece_sign)]
-    return moves_list
+    # The destination squares are precomputed - see constants.py
+    return generate_step_moves(chess, square,
+                               constants.KING_TARGETS[square],
+                               moves_list, piece_sign)
 
 
 def determine_generate_move_method(piece_letter):
@@ -444,22 +243,28 @@ def determine_generate_move_method(piece_letter):
 """ THE END OF PIECES' ROUTINES """
 
 
-def movelist(chess, from_file, from_rank, piece_sign, evaluating=False):
+def movelist(chess, from_square, piece_sign, evaluating=False):
     """
     Generate a list of possible moves for a particular piece
+    'from_square' is a mailbox index
+    Each generated move is a packed integer - see encoding.py
+    constants.MOVE_GENERATOR selects either the mailbox routines above
+    or the bitboard routines in bitboards.py
     """
 
-    index = from_file + from_rank
-    letter = chess.piece_letter(index)
+    if constants.MOVE_GENERATOR == constants.BITBOARD_GENERATOR:
+        return bitboards.movelist(chess, from_square)
+
+    letter = chess.piece_letter(from_square)
     if not letter:
         return []  # blank square
 
     # Determine which function to call
     generate_moves_method = determine_generate_move_method(letter)
     all_the_moves = generate_moves_method(chess,
-                                          from_file, from_rank,
+                                          from_square,
                                           [],
-                                          chess.board[index].sign)
+                                          chess.board[from_square].sign)
 
     return all_the_moves
 
@@ -640,17 +445,18 @@ def handle_player_move_from_keyboard(chess):
     return (do_next, lower_string)
 
 
-def any_promotion(chess, to_file, to_rank):
+def any_promotion(chess, to_square):
     """
     Pawn Promotion:
     Promote Pawn Piece if it reaches the board edge
-    This is done by adding the attributes
+    This is done by setting the attributes
     'promote_letter' and 'promoted_value'
     using the 'promote' method
     """
 
     Game.promoted_piece = ""
-    if to_rank not in ["1", "8"]:
+    row = to_square // 10
+    if row != constants.FIRST_RANK_ROW and row != constants.EIGHTH_RANK_ROW:
         # Not the board edge
         return
 
@@ -664,58 +470,51 @@ def any_promotion(chess, to_file, to_rank):
     CHOICE_LIST = [constants.ROOK_LETTER, constants.BISHOP_LETTER,
                    constants.KNIGHT_LETTER, constants.QUEEN_LETTER]
 
-    to_square = to_file + to_rank
-    if (to_rank == "1"
+    if (row == constants.FIRST_RANK_ROW
        and chess.piece_value(to_square) == -constants.PAWN_VALUE):
 
         # The Computer has reached the bottom of the board
         # Is the Piece an Unpromoted Pawn?
 
-        if hasattr(chess.board[to_square], "promoted_value"):
+        if chess.board[to_square].promoted_value is not None:
             # No!
             return
 
         # Yes!
         # Promote the Black Pawn to a Black Queen
-        chess.board[to_square].promote(constants.QUEEN_LETTER,
-                                       constants.QUEEN_VALUE,
+        # unless the 'evaluate' function chose another piece
+        choice = constants.QUEEN_LETTER
+        move = Game.best_move
+        if (not Game.reading_game_file
+           and move & constants.PROMOTION
+           and constants.SQUARE120[(move >> 6)
+                                   & constants.MOVE_SQUARE_MASK] == to_square):
+            choice = constants.PROMOTION_LETTERS[(move >> 12) & 3]
+
+        chess.board[to_square].promote(choice, CHOICE_DICTIONARY[choice],
                                        constants.COMPUTER)
-        # Record the Promotion in order to 'undo'
-        # if function 'evaluate' has been called
-        if Game.evaluating:
-            Game.undo_stack[-1].add(to_square)
-        else:
-            # Set up a message regarding the promotion
-            Game.promotion_message = "Pawn promoted to Queen"
-
-        Game.promoted_piece = constants.QUEEN_LETTER
+        # Record the Pawn afresh now that it moves as its promoted piece
+        chess.set_square(to_square, chess.board[to_square])
+        # Set up a message regarding the promotion
+        Game.promotion_message = ("Pawn promoted to "
+                                  + chess.board[to_square].piece_string())
+
+        Game.promoted_piece = choice
         return
 
-    if (to_rank == "8"
+    if (row == constants.EIGHTH_RANK_ROW
        and chess.piece_value(to_square) == constants.PAWN_VALUE):
 
         # The Player has reached the top of the board
         # Is the Piece an Unpromoted Pawn?
 
-        if hasattr(chess.board[to_square], "promoted_value"):
+        if chess.board[to_square].promoted_value is not None:
             # No!
             return
 
         # Yes!
 
-        # Is Kool AI Evaluating White's Move?
-        if Game.evaluating:
-            # Promote the White Pawn to a White Queen
-            chess.board[to_square].promote(constants.QUEEN_LETTER,
-                                           constants.QUEEN_VALUE,
-                                           constants.COMPUTER)
-            # Record the Promotion in order to 'undo'
-            # if function 'evaluate' has been called
-            Game.undo_stack[-1].add(to_square)
-            Game.promoted_piece = constants.QUEEN_LETTER
-            return
-
-        # Otherwise Promote the White Pawn to the Player's choice
+        # Promote the White Pawn to the Player's choice
         # First, redisplay board showing the Pawn at the top row/rank
         chess.display(Game.current_print_string)
         if Game.show_taken_message:
@@ -740,8 +539,8 @@ def any_promotion(chess, to_file, to_rank):
         # Promote the Pawn
         chess.board[to_square].promote(choice, CHOICE_DICTIONARY[choice],
                                        constants.PLAYER)
-        # Record the Promotion in order to 'undo'
-        # if function 'evaluate' has been called
+        # Record the Pawn afresh now that it moves as its promoted piece
+        chess.set_square(to_square, chess.board[to_square])
         # Set up a message regarding the promotion
         Game.promotion_message = ("Pawn promoted to "
                                   + chess.board[to_square].piece_string())
@@ -762,75 +561,282 @@ def in_check(chess, user_sign):
     To quote Rod Bird:
     this function [ scans ] all squares to see if any opposition piece
     has the King in Check
+
+    Rather than generate the moves of every opposition piece,
+    start from the square of the User's King and look outwards
+    - see 'is_square_attacked'
     """
-    opponent_sign = -user_sign
-    user_king_value = (constants.VALUE_OF_COMPUTER_KING
-                       if user_sign == constants.COMPUTER
-                       else constants.VALUE_OF_PLAYER_KING)
-
-    # Go through each square on the board
-    for letter in ["a", "b", "c", "d", "e", "f", "g", "h"]:
-        for number in ["1", "2", "3", "4", "5", "6", "7", "8"]:
-            index = letter + number
-            if chess.piece_sign(index) == opponent_sign:
-                all_the_moves = movelist(chess, letter, number,
-                                         opponent_sign, False)
-                # Start scanning each move
-                for m in range(len(all_the_moves)):
-                    if (chess.piece_letter(all_the_moves[m])
-                       == constants.KING_LETTER
-                       and chess.piece_value(all_the_moves[m])
-                       == user_king_value):
-                        # User King is in Check!
-                        return True
-
-    # Indicate that the Opponent King is not in Check at all
-    return False
 
+    king_square = chess.king_squares[user_sign]
+    if king_square is None:
+        # The King has been 'taken' during the evaluation
+        # So there is no King to be in Check
+        return False
+
+    return is_square_attacked(chess, king_square, user_sign)
 
-def make_move_to_square(chess, from_square, to_square, to_file, to_rank):
+
+def is_square_attacked(chess, target_square, user_sign, ignore_square=None):
     """
-    Fill the square with the chess piece
+    Is 'target_square' attacked by any opposition piece of the User?
+    Look outwards from the square
+    i.e. a Knight's move away for an opposition Knight,
+    diagonally forwards for an opposition Pawn,
+    one square away for the opposition King
+    and along each ray for the opposition Rooks, Bishops and Queens
+    Stop as soon as one is found
+
+    'ignore_square' is treated as blank - it is the square of a King
+    that is about to move and so cannot shield a square behind it
+
+    constants.MOVE_GENERATOR selects either this routine
+    or the one in bitboards.py, which uses the magic bitboard tables
     """
-    chess.board[to_square] = chess.board[from_square]
 
-    # erase square vacated
-    chess.board[from_square] = None
-    # promote pawn if it reaches the board edge
-    any_promotion(chess, to_file, to_rank)
+    if constants.MOVE_GENERATOR == constants.BITBOARD_GENERATOR:
+        return bitboards.is_square_attacked(chess, target_square,
+                                            user_sign, ignore_square)
 
+    opponent_sign = -user_sign
+    board = chess.board
+    # 'letters' takes into account any promoted pawns
+    # A blank square has no letter, so its 'sign' is never looked at
+    letters = chess.letters
+
+    for square in constants.KNIGHT_TARGETS[target_square]:
+        if (letters[square] == constants.KNIGHT_LETTER
+           and board[square].sign == opponent_sign):
+            return True
+
+    # An opposition Pawn attacks the square from the squares
+    # that a Pawn of the User's colour would capture on
+    for square in constants.PAWN_CAPTURE_TARGETS[user_sign][target_square]:
+        if (letters[square] == constants.PAWN_LETTER
+           and board[square].sign == opponent_sign):
+            return True
+
+    for square in constants.KING_TARGETS[target_square]:
+        if (letters[square] == constants.KING_LETTER
+           and board[square].sign == opponent_sign):
+            return True
+
+    # Sliding pieces - only the first piece on each ray matters
+    for rays, letter in ((constants.ROOK_RAYS, constants.ROOK_LETTER),
+                         (constants.BISHOP_RAYS, constants.BISHOP_LETTER)):
+        for ray in rays[target_square]:
+            for square in ray:
+                if board[square] is None or square == ignore_square:
+                    continue
+
+                if (board[square].sign == opponent_sign
+                   and letters[square] in (letter, constants.QUEEN_LETTER)):
+                    # Attacked!
+                    return True
+
+                # Blocked - proceed no further along this ray
+                break
+
+    # Indicate that the square is not attacked at all
+    return False
+
+
+def find_checks_and_pins(chess, piece_sign, king_square):
+    """
+    Look outwards from the King's square as 'is_square_attacked' does
+    Return
+    1) the squares of the opposition pieces giving Check
+    2) the squares that a piece other than the King must move to
+       in order to answer a single Check i.e. take the checking piece
+       or block its ray. None if the King is not in Check
+    3) a dictionary of the pinned pieces: for the square of each one,
+       the squares along its ray that it may still move to
+    """
+
+    opponent_sign = -piece_sign
+    board = chess.board
+    letters = chess.letters
+    checkers = []
+    evasion_squares = None
+    pinned = {}
+
+    for targets, letter in (
+            (constants.KNIGHT_TARGETS[king_square], constants.KNIGHT_LETTER),
+            (constants.PAWN_CAPTURE_TARGETS[piece_sign][king_square],
+             constants.PAWN_LETTER)):
+        for square in targets:
+            if (letters[square] == letter
+               and board[square].sign == opponent_sign):
+                checkers.append(square)
+                evasion_squares = [square]
+
+    for rays, letter in ((constants.ROOK_RAYS, constants.ROOK_LETTER),
+                         (constants.BISHOP_RAYS, constants.BISHOP_LETTER)):
+        for ray in rays[king_square]:
+            own_square = None
+            for index, square in enumerate(ray):
+                occupant = board[square]
+                if occupant is None:
+                    continue
+
+                if occupant.sign == piece_sign:
+                    if own_square is not None:
+                        # Two pieces of the King's colour - no pin
+                        break
+                    own_square = square
+                    continue
+
+                if letters[square] in (letter, constants.QUEEN_LETTER):
+                    # The squares from the King up to the opposition piece
+                    line = ray[:index + 1]
+                    if own_square is None:
+                        checkers.append(square)
+                        evasion_squares = line
+                    else:
+                        pinned[own_square] = line
+
+                # Reached an opposition piece - proceed no further
+                break
+
+    return (checkers, evasion_squares, pinned)
+
+
+def legal_movelist(chess, piece_sign, captures_only=False):
+    """
+    Generate all the legal moves of one side
+    or, if 'captures_only', just the legal captures
+    Each generated move is a packed integer - see encoding.py
+
+    Rather than make each move and then see whether the King is in Check,
+    work out beforehand which pieces are pinned to the King
+    and whether the King is in Check - see 'find_checks_and_pins'
+    1) A pinned piece may only move along the ray of its pin
+    2) When in Check, a piece other than the King may only
+       take the checking piece or block its ray
+    3) In Double Check only the King may move
+    4) The King may not move to a square that is attacked
+    Castling and en passant captures are added at the end
+    """
+
+    king_square = chess.king_squares[piece_sign]
+    if king_square is None:
+        # The King has been 'taken' - no moves
+        return []
+
+    (checkers, evasion_squares,
+     pinned) = find_checks_and_pins(chess, piece_sign, king_square)
+    square120 = constants.SQUARE120
+    mask = constants.MOVE_SQUARE_MASK
+    all_the_moves = []
+
+    for from_square in chess.piece_squares(piece_sign):
+        if from_square == king_square:
+            for move in movelist(chess, from_square, piece_sign):
+                if captures_only and not move & constants.CAPTURE:
+                    continue
+                if not is_square_attacked(chess, square120[(move >> 6) & mask],
+                                          piece_sign, king_square):
+                    all_the_moves.append(move)
+            continue
+
+        if len(checkers) > 1:
+            # Double Check
+            continue
+
+        allowed = pinned.get(from_square)
+        for move in movelist(chess, from_square, piece_sign):
+            if captures_only and not move & constants.CAPTURE:
+                continue
+            to_square = square120[(move >> 6) & mask]
+            if allowed is not None and to_square not in allowed:
+                continue
+            if (evasion_squares is not None
+               and to_square not in evasion_squares):
+                continue
+            all_the_moves.append(move)
+
+    en_passant_square = chess.en_passant_square
+    if en_passant_square is not None and len(checkers) < 2:
+        all_the_moves += en_passant_moves(chess, piece_sign,
+                                          en_passant_square)
+
+    if not checkers and chess.castling_rights and not captures_only:
+        all_the_moves += castling_moves(chess, piece_sign)
+
+    return all_the_moves
+
+
+def en_passant_moves(chess, piece_sign, en_passant_square):
+    """
+    The en passant captures onto 'en_passant_square'
+    Taking the Pawn removes two pieces from the same rank at once
+    which can expose the King in a way that a pin does not describe
+    So these rare moves are made and tested for Check
+    """
+
+    board = chess.board
+    captured_square = en_passant_square - 10 * piece_sign
+    captured = board[captured_square]
+    if (board[en_passant_square] is not None or captured is None
+       or captured.sign != -piece_sign
+       or chess.letters[captured_square] != constants.PAWN_LETTER):
+        # Not a square that a Pawn has just passed over
+        return []
+
+    all_the_moves = []
+    # The Pawns that could take are on the squares
+    # that an opposition Pawn would capture on
+    for from_square in (constants.PAWN_CAPTURE_TARGETS[-piece_sign]
+                        [en_passant_square]):
+        if (chess.letters[from_square] == constants.PAWN_LETTER
+           and board[from_square].sign == piece_sign):
+            move = (constants.SQUARE64[from_square]
+                    | constants.MOVE_TO_BITS[en_passant_square]
+                    | constants.EN_PASSANT_CAPTURE)
+            chess.make_move(move)
+            check_flag = in_check(chess, piece_sign)
+            chess.unmake_move()
+            if not check_flag:
+                all_the_moves.append(move)
+
+    return all_the_moves
 
-def test_each_move(chess, who_are_you,
-                   from_square,
-                   to_square):
+
+def castling_moves(chess, piece_sign):
     """
-    Go through each possible move
-    To see if there is a chess move whereby the king
-    is no longer 'in check'
+    The Castling moves of a side that is not in Check
+    The side must still have the right to castle,
+    the squares between the King and the Rook must be blank
+    and the King must not pass through (or land on) an attacked square
     """
 
-    # store From and To data so that it may be restored
-    save_from_square = chess.board[from_square]
-    save_to_square = chess.board[to_square]
-    to_file = to_square[0]
-    to_rank = to_square[1]
+    board = chess.board
+    all_the_moves = []
+    for (right, flag, king_square, to_square,
+         blank_squares, safe_squares) in constants.CASTLING_MOVES[piece_sign]:
+        if not chess.castling_rights & right:
+            continue
+        if any(board[square] is not None for square in blank_squares):
+            continue
+        if any(is_square_attacked(chess, square, piece_sign)
+               for square in safe_squares):
+            continue
+        all_the_moves.append(constants.SQUARE64[king_square]
+                             | constants.MOVE_TO_BITS[to_square] | flag)
 
-    # Make the move so that it can be tested for 'Check'
-    make_move_to_square(chess,
-                        from_square, to_square, to_file, to_rank)
-    check_flag = in_check(chess, who_are_you)
+    return all_the_moves
 
-    # Restore previous squares
-    chess.board[from_square] = save_from_square
-    chess.board[to_square] = save_to_square
 
-    if not check_flag:
-        # A suitable move has been found
-        # Therefore, it is not Checkmate
-        return True
+def make_move_to_square(chess, from_square, to_square):
+    """
+    Fill the square with the chess piece
+    Both squares are mailbox indices
+    """
+    chess.set_square(to_square, chess.board[from_square])
 
-    # Otherwise continue the loop i.e. continue testing
-    return False
+    # erase square vacated
+    chess.set_square(from_square, None)
+    # promote pawn if it reaches the board edge
+    any_promotion(chess, to_square)
 
 
 def is_it_checkmate(chess, who_are_you):
@@ -840,35 +846,15 @@ def is_it_checkmate(chess, who_are_you):
     and there is no possible chess move available
     to save the king
 
-    To determine whether Checkmate:
-    This is done by going through each piece of the same colour as the King
-    To see if there is any move generated which does not put the King in check
-    If there is no such move then CHECKMATE!
+    'legal_movelist' only generates moves that do not leave the King
+    in Check. So if there are none then CHECKMATE!
     """
 
-    # Filter all the squares containing the same colour
-    same_colour_pieces_list = [index for index in constants.PRESET_CHESSBOARD
-                               if chess.piece_sign(index) == who_are_you]
-
-    # Go through each square and see if a piece can make a play
-    # such that the king is no longer under threat
-    for index in same_colour_pieces_list:
-        from_file = index[0]
-        from_rank = index[1]
-        all_the_moves = movelist(chess, from_file, from_rank,
-                                 who_are_you, False)
-
-        # Loop through each possible move
-        for m in range(len(all_the_moves)):
-            exit_loop = test_each_move(chess, who_are_you,
-                                       index, all_the_moves[m])
-
-            if exit_loop:
-                # Not Checkmate!
-                return False
-
-            # Otherwise continue testing
-            continue
+    # Bring the castling rights and en passant square up to date
+    m.set_up_position_state(chess, who_are_you)
+    if legal_movelist(chess, who_are_you):
+        # Not Checkmate!
+        return False
 
     # No move found so definitely Checkmate!
     Game.it_is_checkmate = who_are_you
@@ -6,6 +6,7 @@ from a file and their validation.
 """
 
 import constants
+import encoding
 from game import Game
 import extras as e
 import moves as m
@@ -723,18 +724,18 @@ def find_the_match(chess, all_matched_list,
     """
 
     found_target = None
+    # Translate the squares' names into mailbox indices
+    to_square = constants.SQUARE_INDEX[to_file + to_rank]
 
     for index in all_matched_list:
         from_file = index[0]
         from_rank = index[1]
-        all_the_moves = e.movelist(chess, from_file, from_rank,
+        all_the_moves = e.movelist(chess, constants.SQUARE_INDEX[index],
                                    Game.global_piece_sign, False)
 
-        for m in range(len(all_the_moves)):
-            target_file = all_the_moves[m][0]
-            target_rank = all_the_moves[m][1]
-            if target_file == to_file and target_rank == to_rank:
-                found_target = all_the_moves[m]
+        for move in all_the_moves:
+            if encoding.to_square_of(move) == to_square:
+                found_target = constants.SQUARE_NAME[to_square]
                 break
 
         if found_target:
@@ -776,10 +777,12 @@ def determine_the_move(chess, piece, to_square):
     to_file = to_square[0]
     to_rank = to_square[1]
 
-    # Filter all the squares where both the colour and the piece match
-    all_matched_list = [index for index in constants.PRESET_CHESSBOARD
-                        if chess.piece_sign(index) == Game.global_piece_sign
-                        and chess.piece_letter(index) == piece]
+    # Filter the squares of the pieces of this colour
+    # where the piece matches
+    all_matched_list = [constants.SQUARE_NAME[index]
+                        for index
+                        in chess.piece_squares(Game.global_piece_sign)
+                        if chess.piece_letter(index) == piece]
 
     # Go through each filtered square,
     # generated all the moves for the piece on a filtered square
@@ -799,10 +802,11 @@ def determine_the_capture_by_file(chess, piece, from_file, to_square):
     to_rank = to_square[1]
 
     # Filter all the squares where
-    # The file, the colour and the piece all match
-    all_matched_list = [index for index in constants.PRESET_CHESSBOARD
-                        if index[0] == from_file
-                        and chess.piece_sign(index) == Game.global_piece_sign
+    # The file and the piece both match amongst the pieces of this colour
+    all_matched_list = [constants.SQUARE_NAME[index]
+                        for index
+                        in chess.piece_squares(Game.global_piece_sign)
+                        if constants.SQUARE_NAME[index][0] == from_file
                         and chess.piece_letter(index) == piece]
 
     # Go through each filtered square,
@@ -823,10 +827,11 @@ def determine_the_capture_by_rank(chess, piece, from_rank, to_square):
     to_rank = to_square[1]
 
     # Filter all the squares where
-    # The rank, the colour and the piece all match
-    all_matched_list = [index for index in constants.PRESET_CHESSBOARD
-                        if index[1] == from_rank
-                        and chess.piece_sign(index) == Game.global_piece_sign
+    # The rank and the piece both match amongst the pieces of this colour
+    all_matched_list = [constants.SQUARE_NAME[index]
+                        for index
+                        in chess.piece_squares(Game.global_piece_sign)
+                        if constants.SQUARE_NAME[index][1] == from_rank
                         and chess.piece_letter(index) == piece]
 
     # Go through each filtered square,
@@ -2,7 +2,33 @@
 
 import constants
 import piece
+import piece_square
+import zobrist
 import os
+from bisect import insort
+
+
+class UndoRecord:
+    """
+    Everything needed to take back one move made by 'Game.make_move'
+    A stack of these is allocated once when the Game is created
+    and the records are reused, so making a move allocates nothing
+    """
+
+    __slots__ = ("move", "from_square", "to_square", "captured",
+                 "castling_rights", "en_passant_square", "hash_key")
+
+    def __init__(self):
+        # The packed move (see encoding.py) and its squares
+        self.move = constants.NO_MOVE
+        self.from_square = None
+        self.to_square = None
+        # The piece (or None) that was on 'to_square'
+        self.captured = None
+        # The position's state before the move
+        self.castling_rights = constants.ALL_CASTLING_RIGHTS
+        self.en_passant_square = None
+        self.hash_key = 0
 
 
 class Game:
@@ -15,15 +41,41 @@ class Game:
 
 # Class Variables
 
-    # worth of play
-    score = 0
     # Result of evaluate()
     evaluation_result = 0
-    # Keep a record of the best scored coordinates
-    best_from_file = ""
-    best_from_rank = ""
-    best_to_file = ""
-    best_to_rank = ""
+    # Keep a record of the best scored move (a packed move)
+    best_move = constants.NO_MOVE
+    # The positions evaluated by 'evaluate' - see transposition.py
+    transposition_table = None
+    # How many positions the latest search evaluated
+    search_nodes = 0
+    # Iterative Deepening - see run.think
+    # How deep the current iteration searches
+    search_depth = constants.MAXLEVEL
+    # The deepest iteration that was completed
+    completed_depth = 0
+    # When the search must stop (a time.perf_counter value) or None
+    search_deadline = None
+    # The most positions the search may evaluate or None
+    search_node_limit = None
+    # The Triangular PV Table - see run.update_principal_variation
+    # Row 'level' holds the best line found from that level onwards
+    # in its entries from 'level' up to pv_lengths[level]
+    pv_table = [[constants.NO_MOVE] * constants.MAX_PLY
+                for level in range(constants.MAX_PLY)]
+    pv_lengths = [0] * constants.MAX_PLY
+    # The best line of the last completed iteration (packed moves)
+    # i.e. the Computer's move, the Player's expected reply and so on
+    principal_variation = []
+    # The Aspiration Windows searched by the latest search, in order
+    # Each is (depth, alpha, beta, score, positions evaluated)
+    # - see run.aspiration_search
+    aspiration_windows = []
+    # Lazy SMP - see parallel.py
+    # In a helper process, which helper it is (the main process is 0)
+    search_helper = 0
+    # In a helper process, set to 1 when the main process has finished
+    stop_search = None
     new_from_file = ""
     new_from_rank = ""
     new_to_file = ""
@@ -75,15 +127,31 @@ class Game:
     # For Castling
     evaluate_castle_move = ""
 
-    # For the undo-ing of Pawn Promotions
-    # Grows and Shrinks with the calling of the 'evaluate' function
-    undo_stack = None
-
-    # Flag to indicate that the Kool AI is evaluating its next move
-    evaluating = None
-
     def __init__(self):
         self.board = None
+        # Bitboards kept in step with 'self.board' - see 'set_square'
+        self.colour_bitboards = None
+        self.piece_bitboards = None
+        self.letters = None
+        # Where each side's pieces are - see 'set_square'
+        self.piece_orders = None
+        self.king_squares = None
+        # The state of the position besides the pieces
+        self.castling_rights = constants.ALL_CASTLING_RIGHTS
+        # The square passed over by a Pawn that has just moved two squares
+        self.en_passant_square = None
+        # Whose move it is in this position
+        self.side_to_move = constants.PLAYER
+        # The position's Zobrist hash key - see zobrist.py
+        # Kept up to date by 'set_square' and 'make_move'
+        self.hash_key = 0
+        # The value of the pieces and where they stand, from White's side
+        # Kept up to date by 'set_square' - see piece_square.py
+        self.position_score = 0
+        # The stack of undo records - see 'make_move'
+        self.undo_records = [UndoRecord()
+                             for _ in range(constants.MAX_PLY)]
+        self.ply = 0
         self.fillboard()
 
     def fillboard(self):
@@ -104,9 +172,6 @@ class Game:
         Zero and Space show the empty squares
         Then White at the bottom has positive values
 
-        I chose not to use a 8X8 array with numerical indices
-        for the following reason.
-
         In the Chess World,
         a chessboard consists of eight files and eight ranks.
         Columns are known as files and are labelled left to right with letters,
@@ -126,64 +191,340 @@ class Game:
         a2, b2, c2, d2, e2, f2, g2, h2
         a1, b1, c1, d1, e1, f1, g1, h1
 
-        Therefore, rather than a 8X8 array with numerical indices;
-        instead I chose to use a Python dictionary to reflect the above scheme.
-        The keys being a string e.g. "h8" for the square h8
-        Then each value would be a Piece Class instance
-        of the form Piece(VALUE, LETTER, SIGN)
-
-        Therefore, the Dictionary would look like this
-        {a8:value, b8:value, ..., d1:None, ..., e1:None, a1:value, ...,
-         h1:value}
+        Originally I used a Python dictionary to reflect the above scheme
+        with keys such as "h8". However every probe of the board then
+        needed the key to be rebuilt using chr/ord and string concatenation.
+        Therefore, the board is now a 10x12 mailbox, that is,
+        a list of 120 entries indexed by integer. See constants.py
 
+        Each square of the board holds a Piece Class instance
+        of the form Piece(VALUE, LETTER, SIGN)
         Blank squares have the value None
+        The border squares hold an OffBoard instance
+
+        The square names e.g. "h8" are only used at the I/O edge;
+        constants.SQUARE_INDEX converts them into mailbox indices
 
+        Alongside the mailbox, one bitboard per colour and one per piece
+        letter are kept. So is a list of the squares of each side's pieces
+        These are only ever changed by 'set_square'
         """
-        self.board = dict(
-                 # Black Rooks
-                 a8=piece.Rook(constants.ROOK_VALUE, constants.COMPUTER),
-                 h8=piece.Rook(constants.ROOK_VALUE, constants.COMPUTER),
-                 # Black Knights
-                 b8=piece.Knight(constants.KNIGHT_VALUE, constants.COMPUTER),
-                 g8=piece.Knight(constants.KNIGHT_VALUE, constants.COMPUTER),
-                 # Black Bishops
-                 c8=piece.Bishop(constants.BISHOP_VALUE, constants.COMPUTER),
-                 f8=piece.Bishop(constants.BISHOP_VALUE, constants.COMPUTER),
-                 # Black Queen and King
-                 d8=piece.Queen(constants.QUEEN_VALUE, constants.COMPUTER),
-                 e8=piece.King(constants.KING_VALUE, constants.COMPUTER),
-                 # White Rooks
-                 a1=piece.Rook(constants.ROOK_VALUE, constants.PLAYER),
-                 h1=piece.Rook(constants.ROOK_VALUE, constants.PLAYER),
-                 # White Knights
-                 b1=piece.Knight(constants.KNIGHT_VALUE, constants.PLAYER),
-                 g1=piece.Knight(constants.KNIGHT_VALUE, constants.PLAYER),
-                 # White Bishops
-                 c1=piece.Bishop(constants.BISHOP_VALUE, constants.PLAYER),
-                 f1=piece.Bishop(constants.BISHOP_VALUE, constants.PLAYER),
-                 # White Queen and King
-                 d1=piece.Queen(constants.QUEEN_VALUE, constants.PLAYER),
-                 e1=piece.King(constants.KING_VALUE, constants.PLAYER))
-
-        for letter in ["a", "b", "c", "d", "e", "f", "g", "h"]:
+
+        self.board = [piece.OffBoard()] * constants.MAILBOX_SIZE
+        for index in constants.BOARD_SQUARES:
+            # Blank Squares
+            self.board[index] = None
+
+        self.colour_bitboards = {constants.PLAYER: 0, constants.COMPUTER: 0}
+        self.piece_bitboards = dict.fromkeys([constants.KING_LETTER,
+                                              constants.QUEEN_LETTER,
+                                              constants.ROOK_LETTER,
+                                              constants.BISHOP_LETTER,
+                                              constants.KNIGHT_LETTER,
+                                              constants.PAWN_LETTER], 0)
+        # The letter recorded in the bitboards for each square
+        self.letters = [""] * constants.MAILBOX_SIZE
+        # For each side, the positions within BOARD_SQUARES
+        # of the squares holding its pieces, in ascending order
+        self.piece_orders = {constants.PLAYER: [], constants.COMPUTER: []}
+        # The square of each side's King
+        # None whilst a King has been 'taken' during the evaluation
+        self.king_squares = {constants.PLAYER: None, constants.COMPUTER: None}
+        # Added to by 'set_square' as the pieces are placed
+        self.position_score = 0
+
+        back_rank = [piece.Rook, piece.Knight, piece.Bishop, piece.Queen,
+                     piece.King, piece.Bishop, piece.Knight, piece.Rook]
+        values = [constants.ROOK_VALUE, constants.KNIGHT_VALUE,
+                  constants.BISHOP_VALUE, constants.QUEEN_VALUE,
+                  constants.KING_VALUE, constants.BISHOP_VALUE,
+                  constants.KNIGHT_VALUE, constants.ROOK_VALUE]
+
+        for column, letter in enumerate(["a", "b", "c", "d",
+                                         "e", "f", "g", "h"]):
+            the_class = back_rank[column]
+            # Black Pieces
+            self.set_square(constants.SQUARE_INDEX[letter + "8"],
+                            the_class(values[column], constants.COMPUTER))
+            # White Pieces
+            self.set_square(constants.SQUARE_INDEX[letter + "1"],
+                            the_class(values[column], constants.PLAYER))
             # Black Pawns
-            self.board[letter + "7"] = piece.Pawn(constants.PAWN_VALUE,
-                                                  constants.COMPUTER)
+            self.set_square(constants.SQUARE_INDEX[letter + "7"],
+                            piece.Pawn(constants.PAWN_VALUE,
+                                       constants.COMPUTER))
             # White Pawns
-            self.board[letter + "2"] = piece.Pawn(constants.PAWN_VALUE,
-                                                  constants.PLAYER)
-        # Blank Squares
-        for letter in ["a", "b", "c", "d", "e", "f", "g", "h"]:
-            for number in ["3", "4", "5", "6"]:
-                self.board[letter + number] = None
+            self.set_square(constants.SQUARE_INDEX[letter + "2"],
+                            piece.Pawn(constants.PAWN_VALUE,
+                                       constants.PLAYER))
 
         # Designate the kingside rooks
-        self.board["h8"].kingside = True
-        self.board["h1"].kingside = True
+        self.board[constants.SQUARE_INDEX["h8"]].kingside = True
+        self.board[constants.SQUARE_INDEX["h1"]].kingside = True
 
         # Designate the queenside rooks
-        self.board["a8"].queenside = True
-        self.board["a1"].queenside = True
+        self.board[constants.SQUARE_INDEX["a8"]].queenside = True
+        self.board[constants.SQUARE_INDEX["a1"]].queenside = True
+
+        # From now on the hash key is kept up to date as the board changes
+        self.hash_key = zobrist.calculate_hash_key(self)
+
+    def set_square(self, index, the_piece):
+        """
+        Place 'the_piece' (or None for a blank square)
+        on the square whose mailbox index is 'index'
+        Every change to the board goes through here so that
+        the bitboards, the piece lists and the squares of the Kings
+        always agree with the mailbox
+
+        A Pawn that has been promoted (or had its promotion undone)
+        in place is recorded afresh by calling this method again
+        with the same Pawn
+
+        The hash key has the piece taken off and put on the square
+        XOR-ed out and in
+        Likewise the score of the position has their scores
+        taken away and added
+        """
+
+        bit = constants.SQUARE_BIT[index]
+        order = constants.BOARD_ORDER[index]
+        old_piece = self.board[index]
+        if old_piece is not None:
+            old_letter = self.letters[index]
+            self.colour_bitboards[old_piece.sign] ^= bit
+            self.piece_bitboards[old_letter] ^= bit
+            self.hash_key ^= (zobrist.PIECE_KEYS[old_piece.sign]
+                              [old_letter][index])
+            self.position_score -= (piece_square.SQUARE_SCORES
+                                    [old_piece.sign][old_letter][index])
+            # Remove the square from its side's piece list
+            self.piece_orders[old_piece.sign].remove(order)
+            if self.king_squares[old_piece.sign] == index:
+                self.king_squares[old_piece.sign] = None
+
+        self.board[index] = the_piece
+        if the_piece is None:
+            self.letters[index] = ""
+            return
+
+        # Check first whether it is a promoted pawn
+        # If so, record its promoted piece's 'letter'
+        letter = getattr(the_piece, "promoted_letter", None)
+        if letter is None:
+            letter = the_piece.letter
+        self.letters[index] = letter
+        self.colour_bitboards[the_piece.sign] |= bit
+        self.piece_bitboards[letter] |= bit
+        self.hash_key ^= zobrist.PIECE_KEYS[the_piece.sign][letter][index]
+        self.position_score += (piece_square.SQUARE_SCORES
+                                [the_piece.sign][letter][index])
+        # Add the square to its side's piece list keeping it in order
+        insort(self.piece_orders[the_piece.sign], order)
+        if letter == constants.KING_LETTER:
+            self.king_squares[the_piece.sign] = index
+
+    def make_move(self, move):
+        """
+        Make a move that is going to be taken back by 'unmake_move'
+        i.e. whilst evaluating or whilst testing whether a move is legal
+        'move' is a packed move - see encoding.py
+
+        An undo record is filled in with what the move changes
+        and pushed onto the stack of undo records
+        A promotion promotes the Pawn to the piece given by the move's flags
+        Castling moves the Rook as well as the King
+        En passant removes the Pawn that is taken
+        Return the piece taken (or None)
+        """
+
+        record = self.undo_records[self.ply]
+        self.ply += 1
+
+        from_square = constants.SQUARE120[move & constants.MOVE_SQUARE_MASK]
+        to_square = constants.SQUARE120[(move >> 6)
+                                        & constants.MOVE_SQUARE_MASK]
+        the_piece = self.board[from_square]
+        captured = self.board[to_square]
+        record.move = move
+        record.from_square = from_square
+        record.to_square = to_square
+        record.captured = captured
+        record.castling_rights = self.castling_rights
+        record.en_passant_square = self.en_passant_square
+        record.hash_key = self.hash_key
+
+        self.set_square(to_square, the_piece)
+        self.set_square(from_square, None)
+
+        # A King or Rook leaving its square, or a Rook being taken,
+        # loses the corresponding castling rights
+        castling_rights = (self.castling_rights
+                           & constants.CASTLING_RIGHTS_MASK[from_square]
+                           & constants.CASTLING_RIGHTS_MASK[to_square])
+        # The other side is to move
+        # XOR out the old castling rights and en passant file
+        # XOR in the new ones below
+        self.hash_key ^= (zobrist.SIDE_KEY
+                          ^ zobrist.CASTLING_KEYS[self.castling_rights]
+                          ^ zobrist.CASTLING_KEYS[castling_rights])
+        self.castling_rights = castling_rights
+        self.side_to_move = -self.side_to_move
+
+        if self.en_passant_square is not None:
+            self.hash_key ^= zobrist.en_passant_key(self.en_passant_square)
+            self.en_passant_square = None
+        flags = move & constants.MOVE_FLAGS_MASK
+        if flags == constants.DOUBLE_PAWN_PUSH:
+            # The square passed over
+            self.en_passant_square = (from_square + to_square) // 2
+            self.hash_key ^= zobrist.en_passant_key(self.en_passant_square)
+
+        elif flags == constants.EN_PASSANT_CAPTURE:
+            # The Pawn taken is beside the square moved from
+            captured_square = to_square - 10 * the_piece.sign
+            captured = self.board[captured_square]
+            record.captured = captured
+            self.set_square(captured_square, None)
+
+        elif (flags == constants.KINGSIDE_CASTLE
+              or flags == constants.QUEENSIDE_CASTLE):
+            (rook_from, rook_to) = constants.CASTLING_ROOK_SQUARES[to_square]
+            self.set_square(rook_to, self.board[rook_from])
+            self.set_square(rook_from, None)
+
+        elif flags & constants.PROMOTION:
+            letter = constants.PROMOTION_LETTERS[(flags >> 12) & 3]
+            the_piece.promote(letter, constants.PROMOTION_VALUES[letter],
+                              the_piece.sign)
+            # Record the Pawn afresh now that it moves as its promoted piece
+            self.set_square(to_square, the_piece)
+
+        return captured
+
+    def unmake_move(self):
+        """
+        Take back the last move made by 'make_move'
+        """
+
+        self.ply -= 1
+        record = self.undo_records[self.ply]
+
+        the_piece = self.board[record.to_square]
+        flags = record.move & constants.MOVE_FLAGS_MASK
+        if flags & constants.PROMOTION:
+            # The Pawn is a Pawn once more
+            the_piece.unpromote()
+
+        self.set_square(record.from_square, the_piece)
+        if flags == constants.EN_PASSANT_CAPTURE:
+            self.set_square(record.to_square, None)
+            self.set_square(record.to_square - 10 * the_piece.sign,
+                            record.captured)
+
+        elif (flags == constants.KINGSIDE_CASTLE
+              or flags == constants.QUEENSIDE_CASTLE):
+            self.set_square(record.to_square, None)
+            (rook_from,
+             rook_to) = constants.CASTLING_ROOK_SQUARES[record.to_square]
+            self.set_square(rook_from, self.board[rook_to])
+            self.set_square(rook_to, None)
+
+        else:
+            self.set_square(record.to_square, record.captured)
+        self.castling_rights = record.castling_rights
+        self.en_passant_square = record.en_passant_square
+        self.side_to_move = -self.side_to_move
+        # Rather than XOR back everything that changed
+        self.hash_key = record.hash_key
+
+    def make_null_move(self):
+        """
+        Pass i.e. let the other side move without moving a piece
+        Used by the Null Move Pruning of 'evaluate' - see run.py
+        Taken back by 'unmake_null_move'
+        The undo record of a null move has the move NO_MOVE
+        """
+
+        record = self.undo_records[self.ply]
+        self.ply += 1
+        record.move = constants.NO_MOVE
+        record.en_passant_square = self.en_passant_square
+        record.hash_key = self.hash_key
+
+        # The other side is to move and there is no en passant square
+        self.hash_key ^= (zobrist.SIDE_KEY
+                          ^ zobrist.en_passant_key(self.en_passant_square))
+        self.en_passant_square = None
+        self.side_to_move = -self.side_to_move
+
+    def unmake_null_move(self):
+        """
+        Take back the null move made by 'make_null_move'
+        """
+
+        self.ply -= 1
+        record = self.undo_records[self.ply]
+        self.en_passant_square = record.en_passant_square
+        self.side_to_move = -self.side_to_move
+        self.hash_key = record.hash_key
+
+    def last_move(self):
+        """
+        The packed move last made by 'make_move' and not yet taken back
+        NO_MOVE after a null move or if there is none
+        """
+
+        if self.ply == 0:
+            return constants.NO_MOVE
+        return self.undo_records[self.ply - 1].move
+
+    def has_pieces(self, sign):
+        """
+        Has the side any pieces other than its King and Pawns?
+        """
+
+        kings_and_pawns = (self.piece_bitboards[constants.KING_LETTER]
+                           | self.piece_bitboards[constants.PAWN_LETTER])
+        return self.colour_bitboards[sign] & ~kings_and_pawns != 0
+
+    def set_position_state(self, castling_rights, en_passant_square,
+                           side_to_move):
+        """
+        Set the state of the position besides the pieces
+        and bring the hash key into line with it
+        """
+
+        self.hash_key ^= (zobrist.CASTLING_KEYS[self.castling_rights]
+                          ^ zobrist.CASTLING_KEYS[castling_rights]
+                          ^ zobrist.en_passant_key(self.en_passant_square)
+                          ^ zobrist.en_passant_key(en_passant_square))
+        if side_to_move != self.side_to_move:
+            self.hash_key ^= zobrist.SIDE_KEY
+
+        self.castling_rights = castling_rights
+        self.en_passant_square = en_passant_square
+        self.side_to_move = side_to_move
+
+    def keep_move(self):
+        """
+        The last move made by 'make_move' turned out to be
+        the move actually played. So it stands and is not to be
+        taken back; discard its undo record
+        """
+
+        self.ply -= 1
+
+    def piece_squares(self, sign):
+        """
+        The squares (mailbox indices) of all the pieces of one side
+        in the same order as PRESET_CHESSBOARD ['a1', 'a2' ... 'h7', 'h8']
+        A new list is returned each time,
+        so the board may be changed whilst going through it
+        """
+
+        return [constants.BOARD_SQUARES[order]
+                for order in self.piece_orders[sign]]
 
     def piece_sign(self, index, rank=""):
         """
@@ -193,6 +534,9 @@ class Game:
 
         if rank:
             index += rank
+        if isinstance(index, str):
+            # Translate the square's name e.g. "e4" into its mailbox index
+            index = constants.SQUARE_INDEX[index]
 
         return getattr(self.board[index], "sign", constants.BLANK)
 
@@ -204,6 +548,9 @@ class Game:
 
         if rank:
             index += rank
+        if isinstance(index, str):
+            # Translate the square's name e.g. "e4" into its mailbox index
+            index = constants.SQUARE_INDEX[index]
 
         # Check first whether it is a promoted pawn
         # If so, return its promoted piece's 'value'
@@ -220,6 +567,9 @@ class Game:
 
         if rank:
             index += rank
+        if isinstance(index, str):
+            # Translate the square's name e.g. "e4" into its mailbox index
+            index = constants.SQUARE_INDEX[index]
 
         # Check first whether it is a promoted pawn
         # If so, return its promoted piece's 'letter'
@@ -5,10 +5,11 @@ Castling and En Passant
 """
 
 import constants
+import encoding
 from game import Game
 from run import handle_internal_error
 from run import finalise_player_move
-from extras import in_check, finalise_computer_move, CustomException
+from extras import in_check, finalise_computer_move
 from extras import input_status_message, show_promotion_message
 import fileio as f
 from time import sleep
@@ -148,16 +149,16 @@ def record_if_king_or_rook_has_moved(chess, who_are_you,
     Once such a piece has been move, the Castling move is no longer an option
     Note: the rooks are set up as follows:
         Designate the kingside rooks
-        self.board["h8"].kingside = True
-        self.board["h1"].kingside = True
+        self.board[constants.SQUARE_INDEX["h8"]].kingside = True
+        self.board[constants.SQUARE_INDEX["h1"]].kingside = True
 
         Designate the queenside rooks
-        self.board["a8"].queenside = True
-        self.board["a1"].queenside = True
+        self.board[constants.SQUARE_INDEX["a8"]].queenside = True
+        self.board[constants.SQUARE_INDEX["a1"]].queenside = True
     """
 
     # Note: 'is_piece_a_king' does not regard the colour of the piece
-    index = current_file + current_rank
+    index = constants.SQUARE_INDEX[current_file + current_rank]
     if who_are_you == constants.PLAYER:
         # The Player
 
@@ -390,62 +391,6 @@ def check_castling_valid_part1(chess, who_are_you,
                                       which_castle_side, king_rook_rank)
 
 
-def calculate_new_file(file, number):
-    """
-    Used for the Castling chess move
-    New file = Current file value + number
-    EG h8 + -1 = g8; a8 + 2 = c8
-    """
-
-    new_file = chr(ord(file) + number)
-    # Defensive Programming
-    if not ("a" <= new_file <= "h"):
-        raise CustomException(("Internal Error: File is Off-board "
-                              "{} = {} + {}").format(new_file,
-                                                     file,
-                                                     number))
-
-    return new_file
-
-
-def move_king_one_square(chess, the_king, king_file,
-                         king_rank, king_direction):
-    """
-    Move the king by one square according to the value of 'king_direction'
-    """
-
-    new_king_file = calculate_new_file(king_file, king_direction)
-
-    # fill square with king
-    chess.board[new_king_file + king_rank] = the_king
-
-    # erase square of king now vacated
-    chess.board[king_file + king_rank] = None
-    return new_king_file
-
-
-def restore_original_positions(chess, the_king, the_rook,
-                               the_king_square, the_rook_square,
-                               king_rook_rank, direction):
-    """
-    After attempting a Castling move, it turned out to be illegal
-    Therefore, restore the king and rook to their original positions
-    """
-
-    chess.board[the_king_square] = the_king
-    chess.board[the_rook_square] = the_rook
-
-    # Erase the other squares
-    current_square = the_rook_square
-    new_file = the_king_square[0]
-    while True:
-        new_file = calculate_new_file(new_file, direction)
-        new_square = new_file + king_rook_rank
-        if new_square == the_rook_square:
-            return
-        chess.board[new_square] = None
-
-
 def check_castling_valid_part2(chess, who_are_you, which_castle_side,
                                king_rook_rank, evaluating):
     """
@@ -461,75 +406,54 @@ def check_castling_valid_part2(chess, who_are_you, which_castle_side,
         produce_error_message(constants.KING_IN_CHECK)
         return
 
-    the_king_square = constants.CASTLING_KING_FILE + king_rook_rank
-    the_king = chess.board[the_king_square]
-    king_sign = who_are_you
+    king_square = constants.SQUARE_INDEX[constants.CASTLING_KING_FILE
+                                         + king_rook_rank]
 
     if which_castle_side == constants.KINGSIDE:
         king_direction = 1  # RIGHT
-        rook_direction = -1  # LEFT
-        the_rook_square = constants.KINGSIDE_ROOK_FILE + king_rook_rank
-        the_rook_file = constants.KINGSIDE_ROOK_FILE
-        the_rook = chess.board[the_rook_square]
+        rook_square = constants.SQUARE_INDEX[constants.KINGSIDE_ROOK_FILE
+                                             + king_rook_rank]
     else:
         king_direction = -1  # LEFT
-        rook_direction = 1  # RIGHT
-        the_rook_square = constants.QUEENSIDE_ROOK_FILE + king_rook_rank
-        the_rook_file = constants.QUEENSIDE_ROOK_FILE
-        the_rook = chess.board[the_rook_square]
-
-    new_king_file = constants.CASTLING_KING_FILE
-
-# Move the King by one square
-    new_king_file = move_king_one_square(chess, the_king, new_king_file,
-                                         king_rook_rank, king_direction)
-
-# The king must not pass through a square
-# that is under attack by opponent pieces
-    if in_check(chess, who_are_you):
-        produce_error_message(constants.THROUGH_CHECK)
-        restore_original_positions(chess, the_king, the_rook,
-                                   the_king_square, the_rook_square,
-                                   king_rook_rank, -rook_direction)
-        return
-
-
-# Move the King again by one square
-    new_king_file = move_king_one_square(chess, the_king, new_king_file,
-                                         king_rook_rank, king_direction)
-
-# The king must not pass through a square
-# that is under attack by opponent pieces
-    if in_check(chess, who_are_you):
-        produce_error_message(constants.THROUGH_CHECK)
-        restore_original_positions(chess, the_king, the_rook,
-                                   the_king_square, the_rook_square,
-                                   king_rook_rank, -rook_direction)
-        return
-
-# Now move the Rook on to the other side of the King
-    new_rook_file = calculate_new_file(new_king_file, rook_direction)
-
-# fill square with rook
-    chess.board[new_rook_file + king_rook_rank] = the_rook
-
-# erase square of rook now vacated
-    chess.board[the_rook_file + king_rook_rank] = None
-
-# The king must not end up in check
-    if in_check(chess, who_are_you):
-        produce_error_message(constants.END_UP_IN_CHECK)
-        restore_original_positions(chess, the_king, the_rook,
-                                   the_king_square, the_rook_square,
-                                   king_rook_rank, -rook_direction)
-        return
+        rook_square = constants.SQUARE_INDEX[constants.QUEENSIDE_ROOK_FILE
+                                             + king_rook_rank]
+
+    # Each step is made with 'make_move' so that it can be taken back
+    steps = [
+        # Move the King by one square
+        encoding.encode_move(king_square, king_square + king_direction),
+        # Move the King again by one square
+        encoding.encode_move(king_square + king_direction,
+                             king_square + 2 * king_direction),
+        # Now move the Rook on to the other side of the King
+        encoding.encode_move(rook_square, king_square + king_direction)
+    ]
+    error_codes = [
+        # The king must not pass through a square
+        # that is under attack by opponent pieces
+        constants.THROUGH_CHECK,
+        constants.THROUGH_CHECK,
+        # The king must not end up in check
+        constants.END_UP_IN_CHECK
+    ]
+
+    for count, step in enumerate(steps, start=1):
+        chess.make_move(step)
+        if in_check(chess, who_are_you):
+            produce_error_message(error_codes[count - 1])
+            # Restore the king and rook to their original positions
+            for _ in range(count):
+                chess.unmake_move()
+            return
 
 # This Castling move is valid
 # If evaluating, restore regardless
-    if evaluating:
-        restore_original_positions(chess, the_king, the_rook,
-                                   the_king_square, the_rook_square,
-                                   king_rook_rank, -rook_direction)
+    for _ in steps:
+        if evaluating:
+            chess.unmake_move()
+        else:
+            # The Castling move stands
+            chess.keep_move()
 
     return True  # Successful Castling move
 
@@ -566,6 +490,67 @@ def check_if_castling_move_is_valid(chess, who_are_you, which_castle_side,
     return True
 
 
+def set_up_position_state(chess, who_is_to_move):
+    """
+    Bring the castling rights, the en passant square and the side to move
+    of the position into line with the flags kept by Game
+    'make_move' then keeps them up to date whilst evaluating
+    """
+
+    rights = 0
+    for (sign, castled, king_moved, king_rook_moved, queen_rook_moved,
+         king_rook_rank, kingside_right, queenside_right) in (
+            (constants.PLAYER, Game.player_castled, Game.player_king_moved,
+             Game.player_king_rook_moved, Game.player_queen_rook_moved,
+             constants.PLAYER_SIDE_RANK,
+             constants.PLAYER_KINGSIDE_RIGHT,
+             constants.PLAYER_QUEENSIDE_RIGHT),
+            (constants.COMPUTER, Game.computer_castled,
+             Game.computer_king_moved,
+             Game.computer_king_rook_moved, Game.computer_queen_rook_moved,
+             constants.COMPUTER_SIDE_RANK,
+             constants.COMPUTER_KINGSIDE_RIGHT,
+             constants.COMPUTER_QUEENSIDE_RIGHT)):
+
+        # The King must still be on its square
+        king_square = constants.SQUARE_INDEX[constants.CASTLING_KING_FILE
+                                             + king_rook_rank]
+        if castled or king_moved or chess.king_squares[sign] != king_square:
+            continue
+
+        # So must the Rook
+        if (not king_rook_moved
+           and chess.piece_value(constants.KINGSIDE_ROOK_FILE, king_rook_rank)
+           == constants.ROOK_VALUE * sign):
+            rights |= kingside_right
+        if (not queen_rook_moved
+           and chess.piece_value(constants.QUEENSIDE_ROOK_FILE,
+                                 king_rook_rank)
+           == constants.ROOK_VALUE * sign):
+            rights |= queenside_right
+
+    # Did the opponent's last move advance a pawn two squares?
+    # If so, the en passant square is the square that the pawn passed over
+    if who_is_to_move == constants.COMPUTER:
+        pawn_file = Game.player_pawn_2squares_advanced_file
+        pawn_rank = Game.player_pawn_2squares_advanced_rank
+    else:
+        pawn_file = Game.computer_pawn_2squares_advanced_file
+        pawn_rank = Game.computer_pawn_2squares_advanced_rank
+
+    # 'record_pawn_that_advanced_by2' records any piece that moves
+    # from the second rank to the fourth, so check that it is a Pawn
+    en_passant_square = None
+    if pawn_file not in (None, constants.NOVALUE):
+        pawn_square = constants.SQUARE_INDEX[pawn_file + pawn_rank]
+        if (chess.letters[pawn_square] == constants.PAWN_LETTER
+           and chess.board[pawn_square].sign == -who_is_to_move):
+            en_passant_square = pawn_square + 10 * who_is_to_move
+
+    # This also brings the position's hash key up to date
+    chess.set_position_state(rights, en_passant_square, who_is_to_move)
+
+
 def indicate_castling_done(chess, who_are_you, which_side_castled):
     """
     At this point, Castling has been executed
@@ -745,25 +730,27 @@ def perform_en_passant(chess, from_file, from_rank, to_file, to_rank,
     if Game.opponent_who_are_you == constants.COMPUTER:
         save_captured_file = Game.computer_pawn_2squares_advanced_file
         save_captured_rank = Game.computer_pawn_2squares_advanced_rank
-        save_square = save_captured_file + save_captured_rank
+        save_square = constants.SQUARE_INDEX[save_captured_file
+                                             + save_captured_rank]
         save_captured_pawn = chess.board[save_square]
-        chess.board[save_square] = None
+        chess.set_square(save_square, None)
     else:
         save_captured_file = Game.player_pawn_2squares_advanced_file
         save_captured_rank = Game.player_pawn_2squares_advanced_rank
-        save_square = save_captured_file + save_captured_rank
+        save_square = constants.SQUARE_INDEX[save_captured_file
+                                             + save_captured_rank]
         save_captured_pawn = chess.board[save_square]
-        chess.board[save_square] = None
+        chess.set_square(save_square, None)
 
     # fill square with pawn
-    from_square = from_file + from_rank
+    from_square = constants.SQUARE_INDEX[from_file + from_rank]
     save_from_pawn = chess.board[from_square]
 
-    to_square = to_file + to_rank
-    chess.board[to_square] = chess.board[from_square]
+    to_square = constants.SQUARE_INDEX[to_file + to_rank]
+    chess.set_square(to_square, chess.board[from_square])
 
     # Erase square of 'from' pawn now vacated
-    chess.board[from_square] = None
+    chess.set_square(from_square, None)
 
     # Redisplay the Board After the En Passant Move
     chess.display(display_chess_move)
@@ -772,9 +759,9 @@ def perform_en_passant(chess, from_file, from_rank, to_file, to_rank,
     if in_check(chess, Game.who_are_you):
         # If so, then this En Passant is invalid
         # Restore the pieces back to their original squares/positions
-        chess.board[from_square] = chess.board[to_square]
-        chess.board[save_square] = save_captured_pawn
-        chess.board[to_square] = None
+        chess.set_square(from_square, chess.board[to_square])
+        chess.set_square(save_square, save_captured_pawn)
+        chess.set_square(to_square, None)
         # Redisplay the board
         print("Illegal En Passant - The king must not end up in check")
         Game.en_passant_status = constants.INVALID
@@ -985,7 +972,7 @@ def handle_evaluated_castling_move(chess, computer_move_finalised, the_tuple):
     # The Evaluate Function generated a Castle Move! Perform it
     # Set up variables for Castling
     Game.move_type = constants.CASTLING_MOVE
-    Game.general_string.result = Game.evaluate_castle_move
+    Game.general_string_result = Game.evaluate_castle_move
     Game.evaluate_castle_move = ""  # reset
 
     just_performed_castling = perform_castling(chess, constants.COMPUTER)
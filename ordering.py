@@ -0,0 +1,163 @@
+"""
+ordering.py
+Move Ordering
+
+'evaluate' cuts its search short as soon as a move is found
+that is better than the opponent would ever allow
+So the sooner the best move is tried, the sooner the search is cut short
+and the fewer positions are evaluated
+
+The moves of a position are tried in this order
+1) The move recorded in the transposition table for the position
+   i.e. the best move found when the position was last evaluated
+2) Captures, taking the most valuable piece first (Most Valuable Victim)
+   and, of those, with the least valuable piece first
+   (Least Valuable Attacker) - 'MVV-LVA'
+   e.g. Pawn takes Queen, then Rook takes Queen, then Pawn takes Rook ...
+3) The killer moves of the level being evaluated
+4) Every other move, highest history score first
+
+Killer Moves
+A quiet move (i.e. not a capture) that cut the search short
+is likely to do the same in the other positions at the same level
+e.g. a move that wins a piece whatever the opponent's previous move was
+The last KILLER_SLOTS such moves are kept for each level
+
+The History Table
+Each time a quiet move cuts the search short, its score in the table
+is increased, more so the deeper the position was being evaluated
+The table is indexed by the move's 'from' and 'to' squares only
+so it learns which moves tend to be good whatever the position
+
+Both are kept from one position to the next and from one of the Computer's
+moves to the next; see 'age_move_ordering'
+They are allocated once, so keeping them up to date allocates nothing
+"""
+
+import constants
+
+
+# For each level of 'evaluate', the latest killer moves, latest first
+killer_moves = [[constants.NO_MOVE] * constants.KILLER_SLOTS
+                for level in range(constants.MAX_PLY)]
+
+# Indexed by the 'from' and 'to' squares of a move
+# i.e. move & MOVE_FROM_TO_MASK
+history_scores = [0] * (constants.MOVE_FROM_TO_MASK + 1)
+
+
+def capture_rank(chess, move):
+    """
+    The MVV-LVA rank of a capture; the higher, the sooner it is tried
+    """
+
+    from_square = constants.SQUARE120[move & constants.MOVE_SQUARE_MASK]
+    to_square = constants.SQUARE120[(move >> 6)
+                                    & constants.MOVE_SQUARE_MASK]
+    if move & constants.MOVE_FLAGS_MASK == constants.EN_PASSANT_CAPTURE:
+        # The Pawn taken is not on the 'to' square
+        victim = constants.PAWN_LETTER
+    else:
+        victim = chess.letters[to_square]
+
+    return (constants.PIECE_ORDER_RANKS[victim] * 8
+            - constants.PIECE_ORDER_RANKS[chess.letters[from_square]])
+
+
+def history_score(move):
+    """
+    The history score of a quiet move; the higher, the sooner it is tried
+    """
+
+    return history_scores[move & constants.MOVE_FROM_TO_MASK]
+
+
+def order_moves(chess, all_the_moves, hash_move=constants.NO_MOVE,
+                level=0):
+    """
+    Return the packed moves 'all_the_moves' in the order described above
+    'hash_move' is the transposition table's move for the position
+    It is only tried first if it is one of 'all_the_moves'
+    since two positions may, very rarely, share a hash key
+    Likewise the killer moves of 'level' are only tried
+    if they are among 'all_the_moves'
+    """
+
+    ordered_moves = []
+    captures = []
+    quiet_moves = []
+    for move in all_the_moves:
+        if move == hash_move:
+            ordered_moves.append(move)
+        elif move & constants.CAPTURE:
+            captures.append((capture_rank(chess, move), move))
+        else:
+            quiet_moves.append(move)
+
+    # Python's sort is stable so equally ranked captures
+    # keep the order that they were generated in
+    captures.sort(key=lambda capture: capture[0], reverse=True)
+    ordered_moves.extend(move for (rank, move) in captures)
+
+    for killer in killer_moves[level]:
+        if killer != hash_move and killer in quiet_moves:
+            ordered_moves.append(killer)
+            quiet_moves.remove(killer)
+
+    quiet_moves.sort(key=history_score, reverse=True)
+    ordered_moves.extend(quiet_moves)
+    return ordered_moves
+
+
+def record_cutoff(move, level, depth):
+    """
+    'move' cut short the evaluation of a position at 'level'
+    which was being evaluated 'depth' moves deep
+    If it is a quiet move, make it a killer move of 'level'
+    and increase its history score
+    """
+
+    if move & constants.CAPTURE:
+        # Captures are already tried early
+        return
+
+    killers = killer_moves[level]
+    if killers[0] != move:
+        # Shift the older killer moves along, dropping the oldest
+        killers[1:] = killers[:-1]
+        killers[0] = move
+
+    history_scores[move & constants.MOVE_FROM_TO_MASK] += depth * depth
+
+
+def age_move_ordering():
+    """
+    Called before each of the Computer's searches
+    Two moves have been played since the last search
+    so the killer moves of each level move up two levels
+    to the level at which the same positions are now evaluated
+    The history scores are reduced so that newer cut-offs count for more
+    """
+
+    for level in range(constants.MAX_PLY):
+        if level + 2 < constants.MAX_PLY:
+            killer_moves[level][:] = killer_moves[level + 2]
+        else:
+            killer_moves[level][:] = ([constants.NO_MOVE]
+                                      * constants.KILLER_SLOTS)
+
+    for index in range(len(history_scores)):
+        history_scores[index] //= constants.HISTORY_AGEING_DIVISOR
+
+
+def clear_move_ordering():
+    """
+    Forget every killer move and history score
+    e.g. so that each benchmark position is searched afresh
+    """
+
+    for killers in killer_moves:
+        killers[:] = [constants.NO_MOVE] * constants.KILLER_SLOTS
+
+    for index in range(len(history_scores)):
+        history_scores[index] = 0
@@ -0,0 +1,349 @@
+"""
+parallel.py
+Parallel Search
+
+Python runs the search on one processor core at a time
+So that the other cores of the computer are not left idle
+whilst the Player waits, the search can be shared out
+among several processes in one of two ways
+    python3 run.py --threads 4                    Lazy SMP
+    python3 run.py --threads 4 --parallel root    Root-Parallel Search
+
+Every process uses the same transposition table, held in shared memory
+- see SharedTranspositionTable in transposition.py
+A position evaluated by one process need not be evaluated by another
+
+Lazy SMP
+The main process searches as it would on its own (see run.think)
+Meanwhile each helper process searches the same position,
+deepening one move at a time, until the main process has finished
+The helpers differ slightly from the main process and from each other
+    Every other helper starts at a depth of 2 rather than 1
+    so the helpers are not all evaluating the same depth at once
+    Each helper tries the Computer's moves, after the first,
+    in a different order - see run.evaluate
+Nothing is passed between the processes but the transposition table
+The helpers fill it with results that the main process then finds
+rather than evaluates, so the main process reaches deeper in the same time
+Only the main process's move is played
+
+Root-Parallel Search
+The main process still deepens the search one move at a time
+(see run.think) but at each depth
+1) The best move of the previous depth is searched first, on its own
+   Its score is a bound: any other move must score more to be the best
+2) The rest of the moves are then handed out one at a time
+   to whichever worker process is free
+3) The best move of all is the one with the highest score
+
+The Shared Bound
+The best score found so far at the current depth is kept in
+shared memory (a multiprocessing.Value) that every worker can read
+Each worker searches its move with alpha set to the shared bound
+so a move that cannot beat a move searched by another worker
+is cut short as quickly as possible
+When a worker finds a better score, it raises the shared bound
+
+Each worker process keeps its own move ordering tables
+from one move to the next, so they still help the next depth
+Splitting the root moves gains less the more processes there are:
+most of the time is spent on the first move, which only one process
+can search, and the moves after it can only be cut short
+once a good score has been found
+"""
+
+import atexit
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+from time import perf_counter
+
+import constants
+import extras as e
+import ordering
+import perft
+from extras import SearchBudgetExhausted
+from game import Game
+from transposition import TranspositionTable, SharedTranspositionTable
+
+
+# The constants that the workers take from the main process
+# i.e. those that may be changed from the command line
+WORKER_SETTINGS = ("TRANSPOSITION_TABLE_MB", "MOVE_GENERATOR",
+                   "NULL_MOVE_PRUNING", "NULL_MOVE_REDUCTION",
+                   "LATE_MOVE_REDUCTIONS", "LMR_REDUCTION",
+                   "ASPIRATION_WINDOWS", "ASPIRATION_DELTA")
+
+# In the main process: the pool of worker processes (or None)
+# and how many workers there are
+process_pool = None
+pool_size = 0
+# In the main process: the transposition table shared by every process
+shared_table = None
+# In every process: the best score found so far at the current depth
+shared_bound = None
+# In every process: set to 1 when the main process has finished searching
+# so that the Lazy SMP helpers stop
+stop_search = None
+# Counts the Computer's searches so that the workers know
+# when a new search begins; see 'search_root_move'
+search_number = 0
+last_search_number = 0
+
+
+def start_worker(settings, table_name, bound, stop):
+    """
+    Called in each worker process when it starts
+    """
+
+    global shared_bound, stop_search
+    for (name, value) in settings.items():
+        setattr(constants, name, value)
+    shared_bound = bound
+    stop_search = stop
+    Game.stop_search = stop
+    Game.transposition_table = SharedTranspositionTable(
+        constants.TRANSPOSITION_TABLE_MB, table_name)
+
+
+def start_process_pool(threads):
+    """
+    Start the worker processes for 'threads' processes in all
+    or, for a single thread, search in the main process as usual
+    """
+
+    global process_pool, pool_size, shared_table, shared_bound, stop_search
+    stop_process_pool()
+    if threads <= 1:
+        return
+
+    shared_table = SharedTranspositionTable(constants.TRANSPOSITION_TABLE_MB)
+    Game.transposition_table = shared_table
+    shared_bound = multiprocessing.Value("i", -constants.INFINITE_SCORE)
+    # Read at every position evaluated so it has no lock
+    stop_search = multiprocessing.RawValue("b", 0)
+    settings = {name: getattr(constants, name) for name in WORKER_SETTINGS}
+    if constants.PARALLEL_SEARCH == constants.ROOT_SPLIT:
+        workers = threads
+    else:
+        # The main process is one of the Lazy SMP processes
+        workers = threads - 1
+    process_pool = ProcessPoolExecutor(max_workers=workers,
+                                       initializer=start_worker,
+                                       initargs=(settings, shared_table.name,
+                                                 shared_bound, stop_search))
+    pool_size = threads
+    # However the Chess Program ends e.g. the Player resigning
+    # the shared memory must be removed
+    atexit.register(stop_process_pool)
+
+
+def stop_process_pool():
+    """
+    Stop the worker processes, if any
+    and go back to a transposition table of the main process's own
+    """
+
+    global process_pool, pool_size, shared_table
+    if process_pool is None:
+        return
+    atexit.unregister(stop_process_pool)
+
+    process_pool.shutdown()
+    process_pool = None
+    pool_size = 0
+    Game.transposition_table = TranspositionTable(
+        constants.TRANSPOSITION_TABLE_MB)
+    shared_table.close(remove=True)
+    shared_table = None
+
+
+def start_new_search(number):
+    """
+    Called in a worker process before each of its tasks
+    'number' counts the Computer's searches
+    The transposition table's age is kept up to date by the main process
+    """
+
+    global last_search_number
+    if number != last_search_number:
+        # The first task of a new search by the Computer
+        last_search_number = number
+        ordering.age_move_ordering()
+
+
+def search_root_move(fen, move, depth, deadline, node_limit, number):
+    """
+    Run in a worker process
+    Evaluate the root move 'move' of the position 'fen' to 'depth'
+    with alpha set to the shared bound
+    Return the tuple
+        (score, positions evaluated, whether completed, best line)
+    The score is None if the move could not beat the shared bound
+    or if the search ran out of time before it was completed
+    The best line is the move followed by the replies expected
+    """
+
+    # Imported here since run.py imports this module
+    from run import do_evaluation
+
+    start_new_search(number)
+    chess = Game()
+    piece_sign = perft.set_up_position(chess, fen)
+    Game.search_nodes = 0
+    Game.search_depth = depth
+    Game.search_deadline = deadline
+    Game.search_node_limit = node_limit
+
+    alpha = shared_bound.value
+    try:
+        if alpha > -constants.INFINITE_SCORE:
+            # As in Principal Variation Search (see run.evaluate)
+            # first test whether the move is any better than the bound
+            score = do_evaluation(chess, 1, piece_sign,
+                                  alpha, alpha + 1, move, depth - 1)
+        else:
+            score = alpha + 1
+        if score > alpha:
+            score = do_evaluation(chess, 1, piece_sign,
+                                  alpha, constants.INFINITE_SCORE,
+                                  move, depth - 1)
+    except SearchBudgetExhausted:
+        return (None, Game.search_nodes, False, [])
+
+    if score <= alpha:
+        # Cut short - not the best move
+        return (None, Game.search_nodes, True, [])
+
+    with shared_bound.get_lock():
+        if score > shared_bound.value:
+            shared_bound.value = score
+    # The move and the best line from the level below
+    # see run.update_principal_variation
+    line = [move] + Game.pv_table[2][2:Game.pv_lengths[2]]
+    return (score, Game.search_nodes, True, line)
+
+
+def think_in_parallel(chess, max_depth):
+    """
+    As 'run.think' but with the root moves shared out among
+    the worker processes as described above
+    Return the score of the last completed depth
+    """
+
+    global search_number
+    search_number += 1
+
+    all_the_moves = e.legal_movelist(chess, constants.COMPUTER)
+    if not all_the_moves:
+        # Checkmate or Stalemate - resign as 'evaluate' does
+        return -constants.EVALUATE_THRESHOLD_SCORE
+
+    if constants.SEARCH_TIME_SECONDS is None:
+        deadline = None
+    else:
+        deadline = perf_counter() + constants.SEARCH_TIME_SECONDS
+    fen = perft.position_fen(chess)
+    root_moves = ordering.order_moves(chess, all_the_moves)
+    Game.search_nodes = 0
+    Game.completed_depth = 0
+    # The root moves are searched with the widest window
+    Game.aspiration_windows = []
+    result = constants.EVALUATE_THRESHOLD_SCORE
+    Game.best_move = root_moves[0]
+
+    for depth in range(1, max_depth + 1):
+        # The first depth is always completed so that there is a move
+        depth_deadline = deadline if depth > 1 else None
+        node_limit = None
+        if depth > 1 and constants.SEARCH_NODE_BUDGET is not None:
+            node_limit = constants.SEARCH_NODE_BUDGET - Game.search_nodes
+
+        shared_bound.value = -constants.INFINITE_SCORE
+        # The best move so far is searched first, on its own
+        first_result = process_pool.submit(search_root_move, fen,
+                                           root_moves[0], depth,
+                                           depth_deadline, node_limit,
+                                           search_number).result()
+        futures = [process_pool.submit(search_root_move, fen, move, depth,
+                                       depth_deadline, node_limit,
+                                       search_number)
+                   for move in root_moves[1:]]
+        results = [first_result] + [future.result() for future in futures]
+        Game.search_nodes += sum(nodes for (score, nodes, completed, line)
+                                 in results)
+
+        if not all(completed for (score, nodes, completed, line)
+                   in results):
+            # Out of time part of the way through this depth
+            # A move not completed might have been the best
+            break
+
+        # The best move of all
+        best_score = -constants.INFINITE_SCORE
+        for (score, nodes, completed, line) in results:
+            if score is not None and score > best_score:
+                (best_score, best_line) = (score, line)
+
+        result = best_score
+        Game.best_move = best_line[0]
+        Game.principal_variation = best_line
+        Game.completed_depth = depth
+        # Search the best move first at the next depth
+        root_moves.remove(Game.best_move)
+        root_moves.insert(0, Game.best_move)
+
+        if ((deadline is not None and perf_counter() >= deadline)
+           or (constants.SEARCH_NODE_BUDGET is not None
+               and Game.search_nodes >= constants.SEARCH_NODE_BUDGET)):
+            # No time to start another depth
+            break
+
+    return result
+
+
+def search_as_helper(fen, helper, max_depth, number):
+    """
+    Run in a worker process
+    Search the position 'fen' as Lazy SMP helper number 'helper'
+    (see above) until the main process has finished
+    or 'max_depth' has been reached
+    Return how many positions were evaluated
+    """
+
+    # Imported here since run.py imports this module
+    from run import iterative_deepening
+
+    start_new_search(number)
+    chess = Game()
+    perft.set_up_position(chess, fen)
+    Game.search_nodes = 0
+    Game.search_helper = helper
+    # Only the main process decides when to stop
+    Game.search_deadline = None
+    Game.search_node_limit = None
+    iterative_deepening(chess, max_depth, 1 + helper % 2, set_budget=False)
+    return Game.search_nodes
+
+
+def think_lazy_smp(chess, max_depth, iterative_deepening):
+    """
+    As 'run.think' but with the helper processes searching alongside
+    the main process as described above
+    'iterative_deepening' is run.iterative_deepening
+    Return the score of the main process's last completed depth
+    """
+
+    global search_number
+    search_number += 1
+
+    stop_search.value = 0
+    fen = perft.position_fen(chess)
+    futures = [process_pool.submit(search_as_helper, fen, helper,
+                                   max_depth, search_number)
+               for helper in range(1, pool_size)]
+
+    result = iterative_deepening(chess, max_depth)
+    stop_search.value = 1
+    # Count the helpers' positions too
+    Game.search_nodes += sum(future.result() for future in futures)
+    return result
@@ -0,0 +1,277 @@
+"""
+perft.py
+Performance Test of the move generator
+
+'perft' makes every legal move down to a given depth
+and counts the positions reached at the last depth (the leaf nodes)
+The counts for well known positions are published, see
+https://www.chessprogramming.org/Perft_Results
+So a wrong count shows that the move generator has a bug
+and the time taken shows how fast the move generator is
+
+Run from the command line:
+    python3 run.py --perft              all the reference positions
+    python3 run.py --perft 3            ... to a depth of at most 3
+    python3 run.py --perft 4 --fen "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - -"
+    python3 run.py --perft 2 --divide   the count for each move as well
+"""
+
+import time
+
+import constants
+import encoding
+import extras as e
+import piece
+from game import Game
+
+
+"""
+The Reference Positions
+Each is given in Forsyth-Edwards Notation (FEN)
+together with the known leaf node counts at depths 1, 2, 3 ...
+The deepest counts are left out as they take too long in Python
+"""
+
+REFERENCE_POSITIONS = [
+    ("Initial Position",
+     "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1",
+     [20, 400, 8902, 197281, 4865609]),
+    ("Kiwipete",
+     "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+     [48, 2039, 97862, 4085603]),
+    ("Position 3",
+     "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+     [14, 191, 2812, 43238, 674624]),
+    ("Position 4",
+     "r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1",
+     [6, 264, 9467, 422333]),
+    ("Position 5",
+     "rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8",
+     [44, 1486, 62379, 2103487]),
+    ("Position 6",
+     "r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 "
+     "w - - 0 10",
+     [46, 2079, 89890, 3894594]),
+]
+
+# The deepest that the reference positions are searched by default
+DEFAULT_PERFT_DEPTH = 4
+
+
+def set_up_position(chess, fen):
+    """
+    Place the pieces given by 'fen' on the board
+    together with the castling rights and the en passant square
+    Return the sign of the side to move
+    """
+
+    PIECE_CLASSES = {
+        constants.PAWN_LETTER: (piece.Pawn, constants.PAWN_VALUE),
+        constants.KNIGHT_LETTER: (piece.Knight, constants.KNIGHT_VALUE),
+        constants.BISHOP_LETTER: (piece.Bishop, constants.BISHOP_VALUE),
+        constants.ROOK_LETTER: (piece.Rook, constants.ROOK_VALUE),
+        constants.QUEEN_LETTER: (piece.Queen, constants.QUEEN_VALUE),
+        constants.KING_LETTER: (piece.King, constants.KING_VALUE)
+    }
+
+    fields = fen.split()
+    for square in constants.BOARD_SQUARES:
+        chess.set_square(square, None)
+
+    # The ranks are given from rank 8 down to rank 1
+    for rank_number, rank in enumerate(fields[0].split("/")):
+        file_number = 0
+        for letter in rank:
+            if letter.isdigit():
+                # A number of blank squares
+                file_number += int(letter)
+                continue
+
+            # Upper case for White i.e. the Player
+            sign = (constants.PLAYER if letter.isupper()
+                    else constants.COMPUTER)
+            (the_class, value) = PIECE_CLASSES[letter.upper()]
+            square = constants.SQUARE_INDEX["abcdefgh"[file_number]
+                                            + str(8 - rank_number)]
+            chess.set_square(square, the_class(value, sign))
+            file_number += 1
+
+    rights = 0
+    for letter, right in (("K", constants.PLAYER_KINGSIDE_RIGHT),
+                          ("Q", constants.PLAYER_QUEENSIDE_RIGHT),
+                          ("k", constants.COMPUTER_KINGSIDE_RIGHT),
+                          ("q", constants.COMPUTER_QUEENSIDE_RIGHT)):
+        if len(fields) > 2 and letter in fields[2]:
+            rights |= right
+
+    if len(fields) > 3 and fields[3] != "-":
+        en_passant_square = constants.SQUARE_INDEX[fields[3]]
+    else:
+        en_passant_square = None
+
+    if len(fields) > 1 and fields[1] == "b":
+        side_to_move = constants.COMPUTER
+    else:
+        side_to_move = constants.PLAYER
+
+    chess.set_position_state(rights, en_passant_square, side_to_move)
+    return side_to_move
+
+
+def position_fen(chess):
+    """
+    The reverse of 'set_up_position'
+    Describe the position in Forsyth-Edwards Notation (FEN)
+    e.g. to hand it to another process
+    The move counters are always given as 0 1
+    """
+
+    ranks = []
+    for rank_number in range(8, 0, -1):
+        rank = ""
+        blanks = 0
+        for file_letter in "abcdefgh":
+            square = constants.SQUARE_INDEX[file_letter + str(rank_number)]
+            the_piece = chess.board[square]
+            if the_piece is None:
+                blanks += 1
+                continue
+
+            if blanks:
+                rank += str(blanks)
+                blanks = 0
+            # 'letters' takes into account any promoted pawns
+            letter = chess.letters[square]
+            # Upper case for White i.e. the Player
+            rank += (letter if the_piece.sign == constants.PLAYER
+                     else letter.lower())
+
+        if blanks:
+            rank += str(blanks)
+        ranks.append(rank)
+
+    rights = ""
+    for letter, right in (("K", constants.PLAYER_KINGSIDE_RIGHT),
+                          ("Q", constants.PLAYER_QUEENSIDE_RIGHT),
+                          ("k", constants.COMPUTER_KINGSIDE_RIGHT),
+                          ("q", constants.COMPUTER_QUEENSIDE_RIGHT)):
+        if chess.castling_rights & right:
+            rights += letter
+
+    if chess.en_passant_square is None:
+        en_passant = "-"
+    else:
+        en_passant = ("abcdefgh"[chess.en_passant_square % 10 - 1]
+                      + str(chess.en_passant_square // 10 - 1))
+
+    side = "b" if chess.side_to_move == constants.COMPUTER else "w"
+    return " ".join(["/".join(ranks), side, rights or "-", en_passant,
+                     "0", "1"])
+
+
+def perft(chess, depth, piece_sign):
+    """
+    Count the leaf nodes 'depth' moves ahead
+    At the last depth the moves are counted rather than made
+    """
+
+    all_the_moves = e.legal_movelist(chess, piece_sign)
+    if depth <= 1:
+        return len(all_the_moves) if depth == 1 else 1
+
+    nodes = 0
+    for move in all_the_moves:
+        chess.make_move(move)
+        nodes += perft(chess, depth - 1, -piece_sign)
+        chess.unmake_move()
+
+    return nodes
+
+
+def divide(chess, depth, piece_sign):
+    """
+    As 'perft' but return the leaf node count of each move
+    A list of (move, count) in the order that the moves are generated
+    Comparing these with another program's narrows a wrong count
+    down to the move that causes it
+    """
+
+    counts = []
+    for move in e.legal_movelist(chess, piece_sign):
+        chess.make_move(move)
+        counts.append((move, perft(chess, depth - 1, -piece_sign)))
+        chess.unmake_move()
+
+    return counts
+
+
+def run_perft(name, fen, depth, expected=None, show_divide=False):
+    """
+    Run 'perft' on one position and print the count,
+    whether it matches the expected count,
+    the time taken and the nodes per second
+    Return a tuple: whether the count is right, the count and the time taken
+    """
+
+    chess = Game()
+    piece_sign = set_up_position(chess, fen)
+
+    start = time.perf_counter()
+    if show_divide:
+        counts = divide(chess, depth, piece_sign)
+        nodes = sum(count for (move, count) in counts)
+    else:
+        nodes = perft(chess, depth, piece_sign)
+    elapsed = time.perf_counter() - start
+
+    if expected is None:
+        verdict = ""
+    elif nodes == expected:
+        verdict = "OK"
+    else:
+        verdict = "WRONG - expected " + str(expected)
+
+    nodes_per_second = nodes / elapsed if elapsed > 0 else 0
+    print(f"{name:<18} depth {depth}  nodes {nodes:>10}  "
+          f"{elapsed:8.2f}s  {nodes_per_second:>10.0f} nps  {verdict}")
+
+    if show_divide:
+        for (move, count) in counts:
+            print(f"    {encoding.move_text(move):<6} {count}")
+
+    return (expected is None or nodes == expected, nodes, elapsed)
+
+
+def perft_command(depth=None, fen=None, show_divide=False):
+    """
+    The '--perft' mode of run.py
+    Either run the given position to 'depth'
+    or run every reference position as deep as its known counts go
+    (but no deeper than 'depth')
+    Return True if every count was right
+    """
+
+    if fen:
+        (correct, nodes, elapsed) = run_perft("Position", fen,
+                                              depth or DEFAULT_PERFT_DEPTH,
+                                              None, show_divide)
+        return correct
+
+    all_correct = True
+    total_nodes = 0
+    total_time = 0
+    for (name, fen, counts) in REFERENCE_POSITIONS:
+        deepest = min(len(counts), depth or DEFAULT_PERFT_DEPTH)
+        (correct, nodes, elapsed) = run_perft(name, fen, deepest,
+                                              counts[deepest - 1],
+                                              show_divide)
+        all_correct = all_correct and correct
+        total_nodes += nodes
+        total_time += elapsed
+
+    # The overall speed of the move generator
+    print(f"{'Total':<18}          nodes {total_nodes:>10}  "
+          f"{total_time:8.2f}s  "
+          f"{total_nodes / total_time if total_time > 0 else 0:>10.0f} nps")
+    print("All counts correct" if all_correct else "SOME COUNTS ARE WRONG")
+    return all_correct
@@ -121,6 +121,11 @@ class King(Piece):
 
 
 class Pawn(Piece):
+    # Until the Pawn is promoted
+    promoted_letter = None
+    promoted_value = None
+    promoted_piece_string = None
+
     def __init__(self, value, sign):
         """
         Pawn's value is 100
@@ -134,7 +139,7 @@ class Pawn(Piece):
         String to be outputted for Pawns
         """
         return ("Pawn"
-                if not hasattr(self, "promoted_piece_string")
+                if self.promoted_piece_string is None
                 else self.promoted_piece_string)
 
     def promote(self, letter, value, sign):
@@ -149,3 +154,22 @@ class Pawn(Piece):
                       "Bishop" if letter == constants.BISHOP_LETTER else
                       "Knight")
         self.promoted_piece_string = the_string
+
+    def unpromote(self):
+        """
+        Undo a Pawn Promotion made during the evaluation
+        The Pawn is a Pawn once more
+        """
+        self.promoted_letter = None
+        self.promoted_value = None
+        self.promoted_piece_string = None
+
+
+class OffBoard(Piece):
+    def __init__(self):
+        """
+        Fills the border squares of the 10x12 mailbox
+        Its sign is constants.OFF_BOARD which matches neither colour
+        Therefore, a piece can neither move onto nor capture this square
+        """
+        super().__init__(constants.OFF_BOARD)
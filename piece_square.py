@@ -0,0 +1,108 @@
+"""
+piece_square.py
+Piece-Square Tables
+
+The score of a position is the value of each side's pieces
+plus a little for where each piece stands
+For each kind of piece, a table gives how much it is worth
+on each square of the board (a 'piece-square table')
+
+Rod Bird's comment:
+Work out the score adding a small amount
+to favour forwards and central play
+
+So by default each table holds the same centrality bonus,
+    8 - |4 - file| - |4 - rank|
+counting the files a to h from 0 and the ranks from the eighth rank
+i.e. the most towards e4, the least in the corners
+The tables are given from White's side of the board
+The Black pieces use them upside down so that, for Black, e5 is worth
+what e4 is worth for White
+
+Each table may be changed on its own e.g. to keep the King
+behind its Pawns or to push the Pawns on
+
+Game keeps the score of the position up to date as the pieces move
+rather than adding it up afresh - see Game.set_square
+"""
+
+import constants
+
+
+# The centrality bonus, rank 8 at the top down to rank 1 at the bottom
+CENTRALITY = [
+    [0, 1, 2, 3, 4, 3, 2, 1],
+    [1, 2, 3, 4, 5, 4, 3, 2],
+    [2, 3, 4, 5, 6, 5, 4, 3],
+    [3, 4, 5, 6, 7, 6, 5, 4],
+    [4, 5, 6, 7, 8, 7, 6, 5],
+    [3, 4, 5, 6, 7, 6, 5, 4],
+    [2, 3, 4, 5, 6, 5, 4, 3],
+    [1, 2, 3, 4, 5, 4, 3, 2],
+]
+
+# For each piece letter, its table from White's side of the board
+PIECE_SQUARE_TABLES = {
+    constants.KING_LETTER: CENTRALITY,
+    constants.QUEEN_LETTER: CENTRALITY,
+    constants.ROOK_LETTER: CENTRALITY,
+    constants.BISHOP_LETTER: CENTRALITY,
+    constants.KNIGHT_LETTER: CENTRALITY,
+    constants.PAWN_LETTER: CENTRALITY,
+}
+
+# The value of each kind of piece
+PIECE_VALUES = {
+    constants.KING_LETTER: constants.KING_VALUE,
+    constants.QUEEN_LETTER: constants.QUEEN_VALUE,
+    constants.ROOK_LETTER: constants.ROOK_VALUE,
+    constants.BISHOP_LETTER: constants.BISHOP_VALUE,
+    constants.KNIGHT_LETTER: constants.KNIGHT_VALUE,
+    constants.PAWN_LETTER: constants.PAWN_VALUE,
+}
+
+
+def table_row_and_column(index, sign):
+    """
+    Where the square whose mailbox index is 'index' is found
+    in a table, for a piece of the side 'sign'
+    """
+
+    # The mailbox has a border of one square on the left hand side
+    # and two rows beneath rank 1 - see constants.py
+    column = index % 10 - 1
+    row = constants.EIGHTH_RANK_ROW - index // 10
+    if sign == constants.COMPUTER:
+        # Upside down
+        row = 7 - row
+    return (row, column)
+
+
+# For each colour and piece letter, the score of the piece
+# on each mailbox index i.e. its value plus its table's bonus
+# From White's side: negative for the Black pieces
+# The border squares are never used
+SQUARE_SCORES = {}
+for sign in (constants.PLAYER, constants.COMPUTER):
+    SQUARE_SCORES[sign] = {}
+    for (letter, table) in PIECE_SQUARE_TABLES.items():
+        scores = [0] * constants.MAILBOX_SIZE
+        for index in constants.BOARD_SQUARES:
+            (row, column) = table_row_and_column(index, sign)
+            scores[index] = sign * (PIECE_VALUES[letter] + table[row][column])
+        SQUARE_SCORES[sign][letter] = scores
+
+
+def calculate_position_score(chess):
+    """
+    Calculate the score of the position from scratch, from White's side
+    Used to check the score kept by Game
+    """
+
+    score = 0
+    for square in constants.BOARD_SQUARES:
+        the_piece = chess.board[square]
+        if the_piece is not None:
+            letter = chess.letters[square]
+            score += SQUARE_SCORES[the_piece.sign][letter][square]
+    return score
@@ -0,0 +1,154 @@
+"""
+ponder.py
+Pondering
+
+Whilst the Player thinks about their move, the computer would sit idle
+Instead the Computer 'ponders': it guesses the Player's move
+and searches the position that the move would lead to
+in a background thread, as though the move had already been played
+
+The guess is the Player's reply in the best line of the Computer's
+last search (Game.principal_variation) i.e. the reply that the Computer
+expects from the Player
+The best line stops short when the transposition table already held
+the score of the position after the Computer's move
+The table's best move for that position is then the guess
+The search runs with no time limit until the Player has moved
+
+1) A 'ponder hit': the Player played the move that was guessed
+   The search is already under way, so the Computer's search simply
+   carries on; it is given the time budget from when pondering began
+   So if the Player took longer than the budget, the Computer
+   plays the best move of its last completed depth at once
+2) A 'ponder miss': the Player played another move
+   The search is stopped and the Computer searches as usual
+   The transposition table still holds the positions evaluated
+   whilst pondering, some of which may be reached again
+
+The thread is only started whilst the Player's move is awaited
+from the keyboard, when the main thread is waiting on input()
+It searches a board of its own, so the Player's move
+can be made on the game's board at the same time
+"""
+
+import ctypes
+import threading
+from time import perf_counter
+
+import constants
+import extras as e
+import moves as m
+import ordering
+import perft
+from game import Game
+
+
+# The background thread, whilst the Computer is pondering, or None
+ponder_thread = None
+# The position searched in FEN i.e. after the move that was guessed
+ponder_fen = ""
+# When pondering began (a time.perf_counter value)
+ponder_start = 0
+# The score of the search, once it has finished
+ponder_result = None
+# Set to 1 to stop the search on a ponder miss
+# read by run.search_budget_exhausted as parallel.stop_search is
+stop_pondering = ctypes.c_byte(0)
+
+
+def pondering():
+    """
+    Is the Computer pondering?
+    """
+
+    return ponder_thread is not None
+
+
+def ponder_search(chess):
+    """
+    Run in the background thread
+    Search the position that the Player's guessed move leads to
+    """
+
+    # Imported here since run.py imports this module
+    from run import iterative_deepening
+
+    global ponder_result
+    ponder_result = iterative_deepening(chess, constants.MAXLEVEL,
+                                        set_budget=False)
+
+
+def start_pondering(chess):
+    """
+    Called whilst the Player's move is awaited from the keyboard
+    Start pondering, if the Computer is not doing so already
+    and it expects a move from the Player
+    """
+
+    global ponder_thread, ponder_fen, ponder_start, ponder_result
+    if (not constants.PONDERING or ponder_thread is not None
+       or not Game.principal_variation):
+        return
+
+    # A board of the thread's own, with the Player to move
+    # then with the Player's guessed move made
+    m.set_up_position_state(chess, constants.PLAYER)
+    ponder_chess = Game()
+    perft.set_up_position(ponder_chess, perft.position_fen(chess))
+    if len(Game.principal_variation) > 1:
+        guessed_move = Game.principal_variation[1]
+    else:
+        entry = Game.transposition_table.probe(ponder_chess.hash_key)
+        guessed_move = constants.NO_MOVE if entry is None else entry[3]
+    if guessed_move not in e.legal_movelist(ponder_chess, constants.PLAYER):
+        return
+    ponder_chess.make_move(guessed_move)
+    ponder_fen = perft.position_fen(ponder_chess)
+
+    # Pondering is the start of the Computer's next search
+    Game.transposition_table.new_search()
+    ordering.age_move_ordering()
+    Game.search_nodes = 0
+    Game.search_deadline = None
+    Game.search_node_limit = None
+    Game.stop_search = stop_pondering
+    stop_pondering.value = 0
+    ponder_result = None
+    ponder_start = perf_counter()
+
+    # A daemon thread does not keep the Chess Program running
+    # if the game ends whilst pondering
+    ponder_thread = threading.Thread(target=ponder_search,
+                                     args=(ponder_chess,), daemon=True)
+    ponder_thread.start()
+
+
+def finish_pondering(chess):
+    """
+    Called once the Player has moved and 'chess' has the Computer to move
+    On a ponder hit, let the search finish within the time budget
+    and return its score
+    On a ponder miss, stop the search and return None
+    as also when the Computer was not pondering
+    """
+
+    global ponder_thread
+    if ponder_thread is None:
+        return None
+
+    if perft.position_fen(chess) == ponder_fen:
+        # The time budget counts from when pondering began
+        if constants.SEARCH_TIME_SECONDS is not None:
+            Game.search_deadline = max(
+                ponder_start + constants.SEARCH_TIME_SECONDS, perf_counter())
+        Game.search_node_limit = constants.SEARCH_NODE_BUDGET
+        print("I guessed your move!")
+    else:
+        stop_pondering.value = 1
+
+    ponder_thread.join()
+    ponder_thread = None
+    Game.stop_search = None
+    if stop_pondering.value:
+        return None
+    return ponder_result
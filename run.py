@@ -12,6 +12,7 @@ Menezes' QBASIC program can be found at
 """
 
 import constants
+import encoding
 import piece
 from game import Game
 import moves as m
@@ -19,8 +20,18 @@ import fileio as f
 import extras as e
 import os
 import re
-from time import sleep
+import sys
+import argparse
+import compare_movegen
+import perft
+import bench
+import parallel
+import ponder
+from transposition import TranspositionTable
+from ordering import order_moves, record_cutoff, age_move_ordering
+from time import sleep, perf_counter
 from extras import CustomException, in_check, is_it_checkmate
+from extras import SearchBudgetExhausted
 from extras import finalise_computer_move
 
 
@@ -96,7 +107,7 @@ def is_piece_taken(chess, to_file, to_rank, piece_sign):
     else:
         message = "Player took my "
 
-    index = to_file + to_rank
+    index = constants.SQUARE_INDEX[to_file + to_rank]
     Game.show_taken_message = message + chess.board[index].piece_string()
     return piece_taken
 
@@ -112,15 +123,20 @@ def is_player_move_illegal(chess, from_file, from_rank, to_file, to_rank):
     """
 
     piece_sign = constants.PLAYER  # white piece
-    all_possible_moves = e.movelist(chess, from_file, from_rank,
-                                    piece_sign, False)
+    # Translate the squares' names into mailbox indices
+    from_square = constants.SQUARE_INDEX[from_file + from_rank]
+    to_square = constants.SQUARE_INDEX[to_file + to_rank]
 
-    from_square = from_file + from_rank
-    to_square = to_file + to_rank
+    # Bring the castling rights and en passant square up to date
+    m.set_up_position_state(chess, piece_sign)
 
-    # Start scanning each move
-    for m in range(len(all_possible_moves)):
-        if all_possible_moves[m] == to_square:
+    # 'legal_movelist' only generates moves
+    # that do not place the PLAYER in Check
+    # Castling and En Passant moves are handled by their own routines
+    for move in e.legal_movelist(chess, piece_sign):
+        if (encoding.from_square_of(move) == from_square
+           and encoding.to_square_of(move) == to_square
+           and encoding.flags_of(move) not in constants.SPECIAL_MOVE_FLAGS):
 
             """
             Found the move that matches the Piece,
@@ -135,37 +151,31 @@ def is_player_move_illegal(chess, from_file, from_rank, to_file, to_rank):
             taken = is_piece_taken(chess, to_file, to_rank, piece_sign)
             # No error raised - so the above test passed
 
-            # store From and To data so that it may be restored
-            save_from_square = chess.board[from_square]
-            save_to_square = chess.board[to_square]
-
             # Make the Player's move
-            e.make_move_to_square(chess,
-                                  from_square, to_square, to_file, to_rank)
-
-            # Does this PLAYER's move place the PLAYER in Check?
-            # If so, illegal move!
-
-            check_flag = in_check(chess, constants.PLAYER)
-            if check_flag:
-                # reset play and restore board pieces
-                print("You are in Check")
-                chess.board[from_square] = save_from_square
-                chess.board[to_square] = save_to_square
-                # Indicate that the chosen move placed the Player in Check
-                return (True, True, taken)
+            # (asking which piece to promote a Pawn to, if need be)
+            e.make_move_to_square(chess, from_square, to_square)
 
             # Indicate not in check
             return (False, False, taken)
 
+    # Not a legal move
+    # However, if the chosen piece can make that move
+    # then the move must place the PLAYER in Check
+    for move in e.movelist(chess, from_square, piece_sign, False):
+        if encoding.to_square_of(move) == to_square:
+            taken = is_piece_taken(chess, to_file, to_rank, piece_sign)
+            print("You are in Check")
+            # Indicate that the chosen move placed the Player in Check
+            return (True, True, taken)
+
     # Indicate that no legal move has been found
     return (True, None, None)
 
 
-def coords_formula(file, rank):
+def coords_formula(square):
     """
     Need to convert chessboard squares coordinates
-    from chess algebraic notation to
+    from the mailbox index to
     computer array notation
     COLUMN FIRST that is Y then X
 
@@ -183,136 +193,81 @@ def coords_formula(file, rank):
     etc
     """
 
-    file_number = ord(file) - constants.ASCII_A  # 97
-    rank_number = constants.ASCII_EIGHT - ord(rank)
+    # The mailbox has a border of one square on the left hand side
+    # and two rows beneath rank 1 - see constants.py
+    file_number = square % 10 - 1
+    rank_number = constants.EIGHTH_RANK_ROW - square // 10
     return (file_number, rank_number)
 
 
-def undo_pawn_promotions(chess):
-    """
-    # Remove any Pawn Promotions that may have occurred
-    # during evaluation
-    'Game.undo_stack' is a list of sets that grows/shrinks
-    with the call of 'evaluate'
-    evaluate() may be called up to 5 levels deep
-    So if for example, when level 3 goes to level 4
-    Any pawn promotions that occur will be added to level 4's Set
-    When 'evaluate' returns to level 3;
-    Compare the sets of level 3 and level 4
-    Any new pawn promotions that have been added since level 3
-    which are shown in level 4's Set stack need to be removed
-    That way, when another call is made to level 4,
-    the chessboard is identical regarding 'level 3'
-    including any pawn promotions
-    """
-    Game.promoted_piece = ""  # reset
-    if not Game.undo_stack[-1]:
-        return
-
-    undo_set = Game.undo_stack[-1]
-    for index in undo_set:
-        # Remove the Pawn Promotion attributes
-        # i.e. Undo them!
-        del chess.board[index].promoted_value
-        del chess.board[index].promoted_letter
-        # empty the set
-    Game.undo_stack[-1].clear()
-
-
-def do_evaluation(chess, level, piece_sign, prune_factor,
-                  from_file, from_rank,
-                  to_file, to_rank,
-                  bestscore):
+def captured_value(chess, move, piece_sign):
     """
-    Perform the evaluation using minimax/negamax formula
+    The value of the piece taken by 'move' (0 if none)
+    for the side making it
+    'move' is a packed move - see encoding.py
     """
 
-    from_square = from_file + from_rank
-    to_square = to_file + to_rank
-
-    # store From and To data so that it may be restored
-    save_from_square = chess.board[from_square]
-    save_to_square = chess.board[to_square]
-    targetvalue = chess.piece_value(to_square)
-    (to_file_number, to_rank_number) = coords_formula(to_file, to_rank)
-    # Make the move so that it can be evaluated
-    e.make_move_to_square(chess,
-                          from_square, to_square, to_file, to_rank)
+    to_square = constants.SQUARE120[(move >> 6)
+                                    & constants.MOVE_SQUARE_MASK]
+    if move & constants.MOVE_FLAGS_MASK == constants.EN_PASSANT_CAPTURE:
+        # The Pawn taken is not on the 'to' square
+        targetvalue = chess.piece_value(to_square - 10 * piece_sign)
+    else:
+        targetvalue = chess.piece_value(to_square)
 
-    # negamax formula
-    if level < constants.MAXLEVEL:
-        temp_calc = (bestscore - targetvalue + piece_sign
-                     * (8 - abs(4 - to_file_number) - abs(4 - to_rank_number)))
+    # A piece taken is the opponent's so its value has the opponent's sign
+    return -piece_sign * targetvalue
 
-        Game.score += evaluate(chess,
-                               level,
-                               -piece_sign,
-                               temp_calc)
 
+def do_evaluation(chess, level, piece_sign, alpha, beta, move, depth):
     """
-    Rod Bird's comment:
-    Unwind the recursion by coming back here
-    until we finally return to the main program flow
-    Work out the score adding a small amount
-    to favour forwards and central play
+    Evaluate one move of the position being evaluated by 'evaluate'
+    'move' is a packed move - see encoding.py
+    Return the score of the move for the side making it
+    i.e. the score of the position that the opponent
+    is left with after the best reply (the negamax formula)
+    'alpha' and 'beta' are the window of 'evaluate' - see below
+    'depth' is how many moves deep the opponent's replies are evaluated
     """
 
-    temp_calc = (8 - abs(4 - to_file_number) - abs(4 - to_rank_number))
-    Game.score += targetvalue - piece_sign * temp_calc
+    # Make the move so that the opponent's replies can be evaluated
+    # It is taken back (including any pawn promotion) by 'unmake_move'
+    chess.make_move(move)
 
     """
-    Rod Bird's comment:
-    If it results in a better score than previously
-    then store it as the best
+    negamax formula
+    The opponent's score is from the opponent's side of the board
+    so it is negated
+    The window is seen from the opponent's side too:
+    this move's score lies between alpha and beta when the opponent's
+    score lies between -beta and -alpha
     """
 
-    if ((piece_sign < 0 and Game.score > bestscore)
-       or
-       (piece_sign > 0 and Game.score < bestscore)):
-        bestscore = Game.score
-        if level == 1:
-            # Record the best move found so far
-            Game.best_from_file = from_file
-            Game.best_from_rank = from_rank
-            Game.best_to_file = to_file
-            Game.best_to_rank = to_rank
-
-        # Undo any pawn promotions
-        undo_pawn_promotions(chess)
-        # Restore previous squares
-        chess.board[from_square] = save_from_square
-        chess.board[to_square] = save_to_square
-
-        """
-        Rod Bird's comment:
-        If it is not as good as a previous piece move
-        then cut the search short
-        Exit the loop in 'evaluate'
-        """
+    score = -evaluate_reply(chess, level, -piece_sign, -beta, -alpha, depth)
 
-        if ((piece_sign < 0 and bestscore >= prune_factor)
-           or
-           (piece_sign > 0 and bestscore <= prune_factor)):
-            exitloop = True
+    # Take back the move
+    chess.unmake_move()
+    return score
 
-        else:
-            # Continue the loop i.e. continue evaluating
-            exitloop = False
 
-        return (exitloop, bestscore)
+def evaluate_reply(chess, level, piece_sign, alpha, beta, depth):
+    """
+    Evaluate the position after a move (or a null move) at 'level'
+    'depth' moves deep, the same as 'evaluate'
+    except that at a depth of 0 only the captures are evaluated
+    """
 
-    # Undo any pawn promotions
-    undo_pawn_promotions(chess)
-    # Restore previous squares
-    chess.board[from_square] = save_from_square
-    chess.board[to_square] = save_to_square
+    if depth > 0:
+        return evaluate(chess, level, piece_sign, alpha, beta, depth)
 
-    # Continue the loop i.e. continue evaluating
-    exitloop = False
-    return (exitloop, bestscore)
+    # As deep as this search goes
+    # so the best line from here ends with the move just made
+    Game.pv_lengths[level + 1] = level + 1
+    # Only the captures that follow are evaluated - see 'quiesce'
+    return quiesce(chess, piece_sign, alpha, beta)
 
 
-def evaluate(chess, level, piece_sign, prune_factor):
+def evaluate(chess, level, piece_sign, alpha, beta, depth):
     """
     To quote Rod Bird:
     This function checks all squares for players
@@ -325,70 +280,450 @@ def evaluate(chess, level, piece_sign, prune_factor):
     to its a negamax form with pruning
     i.e. it does not waste time on lower value plays.
 
-    To cater for any 'pawn promotions' that occur during evaluation
-    'Game.undo_stack' is used to keep a record of any new promotions
-    that will be 'undone' when 'evaluate' returns
+    The score returned is from the side of 'piece_sign'
+    i.e. the higher the better for the user to move
+    'alpha' and 'beta' are the Alpha-Beta window
+    alpha: the score that this user is already sure of elsewhere
+           so a lower score here makes no difference
+    beta:  the most that the opponent allows this user elsewhere
+           so once a move scores this much, the other moves
+           need not be evaluated - the opponent avoids this position
+    A score outside the window is only a bound on the true score
+    'depth' is how many moves deep this position is to be evaluated
+
+    Each move is made with 'make_move' and taken back with 'unmake_move'
+    which between them also take care of any 'pawn promotions'
     """
 
     # Update recursion level
     level += 1
-    if level > constants.MAXLEVEL:
+    if level >= constants.MAX_PLY - 1:
         raise CustomException("Internal Error: Level Number Overflow: "
               + str(level))
+    # No best line found from here yet
+    Game.pv_lengths[level] = level
 
-    # Add an empty set to the stack
-    Game.undo_stack.append(set())
+    """
+    Has this position already been evaluated at least as deeply?
+    (The top level always searches so as to record the best move)
+    An exact score can be used as it is
+    A lower bound can be used if it is at least beta
+    and an upper bound if it is at most alpha
+    since the score is then outside the window anyway
+    """
 
-    bestscore = constants.EVALUATE_THRESHOLD_SCORE * piece_sign
-    # Go through each square on the board
+    table = Game.transposition_table
+    # The table's best move for the position, tried first - see ordering.py
+    hash_move = constants.NO_MOVE
+    if table is not None:
+        entry = table.probe(chess.hash_key)
+        if entry is not None:
+            (entry_depth, score, bound, hash_move) = entry
+            if (level > 1 and entry_depth >= depth
+               and (bound == constants.EXACT_BOUND
+                    or (bound == constants.LOWER_BOUND and score >= beta)
+                    or (bound == constants.UPPER_BOUND
+                        and score <= alpha))):
+                return score
+
+    Game.search_nodes += 1
+    # The first iteration is always completed so that there is a move to play
+    if Game.search_depth > 1 and search_budget_exhausted():
+        raise SearchBudgetExhausted()
+
+    # Neither pruning nor reductions are safe whilst in Check
+    checked = in_check(chess, piece_sign)
 
     """
-    PRESET_CHESSBOARD is a list containing the entire chessboard coordinates
-    ['a1', 'a2' ... 'h7', 'h8']
-    In order to
-    1) save time in regards to generating such a list from scratch
-    2) the need for two nested for-loops in regards to generating the list
-    3) Instead I filter PRESET_CHESSBOARD for all the pieces of
-       the same colour of the current user using a List Comprehension
+    Null Move Pruning
+    Let the opponent move twice in a row i.e. pass (a 'null move')
+    and evaluate the position less deeply than usual
+    (by NULL_MOVE_REDUCTION moves more) with a null window at beta
+    If the user to move would still score at least beta,
+    then with an actual move the score would surely be even better
+    so the opponent avoids this position: cut the evaluation short
+    This does not hold when the user to move is in Check,
+    nor when any move would make things worse (zugzwang)
+    which happens mostly in endgames of only Kings and Pawns
+    Two null moves in a row would just give back the same position
     """
 
-    same_colour_pieces_list = [index for index in constants.PRESET_CHESSBOARD
-                               if chess.piece_sign(index) == piece_sign]
+    reduction = constants.NULL_MOVE_REDUCTION
+    if (constants.NULL_MOVE_PRUNING
+       and level > 1
+       and depth > reduction
+       and not checked
+       and chess.last_move() != constants.NO_MOVE
+       and chess.has_pieces(piece_sign)):
+        chess.make_null_move()
+        score = -evaluate_reply(chess, level, -piece_sign,
+                                -beta, -beta + 1, depth - 1 - reduction)
+        chess.unmake_null_move()
+        if score >= beta:
+            return beta
+
+    """
+    Go through each legal move of the current user
+    No move leaves the current user's King in Check
+    so no time is spent evaluating the replies to illegal moves
+    The moves are tried in the order most likely
+    to cut the evaluation short - see ordering.py
+    """
 
-    for index in same_colour_pieces_list:
-        # Have a same coloured piece - evaluate its score
-        from_file = index[0]
-        from_rank = index[1]
+    all_the_moves = e.legal_movelist(chess, piece_sign)
+    if not all_the_moves:
+        # Checkmate or Stalemate
+        # At the top level, the Computer has no move to play
+        # so return a losing score in order to resign
+        if level > 1 and not checked:
+            # Stalemate - neither side wins
+            return 0
+        return -constants.EVALUATE_THRESHOLD_SCORE
+
+    bestscore = -constants.INFINITE_SCORE
+    best_move = constants.NO_MOVE
+    original_alpha = alpha
+    """
+    Principal Variation Search (PVS)
+    The first move, most likely the best thanks to the move ordering,
+    is evaluated with the full window
+    Each other move is only tested against a 'null window'
+    (alpha, alpha + 1) i.e. whether it is any better than alpha
+    This is quicker as far more of the search is cut short
+    Only a move that turns out to be better is evaluated again
+    with the full window to find its actual score
+
+    Late Move Reductions (LMR)
+    A quiet move tried late is unlikely to be the best
+    since the move ordering put it after the hash move, the captures,
+    the killer moves and the quiet moves with better history scores
+    So it is evaluated LMR_REDUCTION moves less deeply
+    (and one move less deeply again from the LMR_LATER_MOVES'th move on)
+    Only if it turns out better than alpha is it evaluated again
+    to the full depth
+    """
 
-        all_the_moves = e.movelist(chess, from_file, from_rank,
-                                   piece_sign, level == 1)
+    reduce_late_moves = (constants.LATE_MOVE_REDUCTIONS
+                         and depth >= constants.LMR_MIN_DEPTH
+                         and not checked)
+    ordered_moves = order_moves(chess, all_the_moves, hash_move, level)
+    if level == 1 and Game.search_helper and len(ordered_moves) > 2:
+        # A Lazy SMP helper (see parallel.py) tries the Computer's moves
+        # after the first in a different order from the other processes
+        # so that they do not all evaluate the same positions
+        turn = 1 + Game.search_helper % (len(ordered_moves) - 1)
+        ordered_moves[1:] = ordered_moves[turn:] + ordered_moves[1:turn]
+    # Loop through each possible move
+    for (move_number, move) in enumerate(ordered_moves):
+        if move_number == 0:
+            score = do_evaluation(chess, level, piece_sign,
+                                  alpha, beta, move, depth - 1)
+        else:
+            if (reduce_late_moves
+               and move_number >= constants.LMR_FULL_DEPTH_MOVES
+               and not move & (constants.CAPTURE | constants.PROMOTION)):
+                reduction = constants.LMR_REDUCTION
+                if move_number >= constants.LMR_LATER_MOVES:
+                    # Even less likely to be the best
+                    reduction += 1
+                score = do_evaluation(chess, level, piece_sign,
+                                      alpha, alpha + 1, move,
+                                      max(depth - 1 - reduction, 0))
+            else:
+                # Evaluate to the full depth straightaway
+                score = alpha + 1
 
-        # Loop through each possible move
-        for m in range(len(all_the_moves)):
-            (to_file, to_rank) = all_the_moves[m]
-            oldscore = Game.score
-            (exit_loop, bestscore) = do_evaluation(chess, level,
-                                                   piece_sign,
-                                                   prune_factor,
-                                                   from_file, from_rank,
-                                                   to_file, to_rank,
-                                                   bestscore)
+            if score > alpha:
+                score = do_evaluation(chess, level, piece_sign,
+                                      alpha, alpha + 1, move, depth - 1)
+            if alpha < score < beta:
+                # Better than alpha - find the actual score
+                score = do_evaluation(chess, level, piece_sign,
+                                      alpha, beta, move, depth - 1)
 
-            # Restore 'score'
-            Game.score = oldscore
-            if exit_loop:
-                # Pop the stack
-                Game.undo_stack.pop()
-                return bestscore  # Done!
+        """
+        Rod Bird's comment:
+        If it results in a better score than previously
+        then store it as the best
+        """
 
-            # Otherwise continue evaluating
+        if score <= bestscore:
             continue
 
-    # Pop the stack
-    Game.undo_stack.pop()
+        bestscore = score
+        best_move = move
+        if level == 1:
+            # Record the best move found so far
+            # It is only turned back into the squares' names for output
+            Game.best_move = move
+
+        if score > alpha:
+            alpha = score
+            update_principal_variation(level, move)
+            if alpha >= beta:
+                # The opponent would not allow this position
+                # so cut the evaluation short
+                # Remember the move for the positions evaluated hereafter
+                record_cutoff(move, level, depth)
+                break
+
+    if table is not None:
+        if bestscore >= beta:
+            # Cut short - the score is at least this
+            bound = constants.LOWER_BOUND
+        elif bestscore <= original_alpha:
+            # No move reached alpha - the score is at most this
+            bound = constants.UPPER_BOUND
+        else:
+            bound = constants.EXACT_BOUND
+        table.store(chess.hash_key, depth, bestscore, bound, best_move)
+
     return bestscore  # Done!
 
 
+def update_principal_variation(level, move):
+    """
+    The Triangular PV Table
+    'move' is the best move found so far at 'level'
+    so the best line from 'level' is 'move' followed by
+    the best line found from the next level, which the evaluation of
+    'move' has just left in the next row of the table
+    The rows get shorter level by level, hence 'triangular'
+    The top row holds the Principal Variation: the line of play
+    that the search expects, without having to search for it again
+    """
+
+    row = Game.pv_table[level]
+    next_row = Game.pv_table[level + 1]
+    next_length = Game.pv_lengths[level + 1]
+    row[level] = move
+    row[level + 1:next_length] = next_row[level + 1:next_length]
+    Game.pv_lengths[level] = next_length
+
+
+def is_losing_capture(chess, move, piece_sign):
+    """
+    Is 'move' a capture that probably loses material?
+    i.e. a piece takes a less valuable piece that is defended
+    so the piece is likely to be taken back
+    """
+
+    from_square = constants.SQUARE120[move & constants.MOVE_SQUARE_MASK]
+    to_square = constants.SQUARE120[(move >> 6)
+                                    & constants.MOVE_SQUARE_MASK]
+    if move & constants.MOVE_FLAGS_MASK == constants.EN_PASSANT_CAPTURE:
+        # A Pawn takes a Pawn
+        return False
+
+    ranks = constants.PIECE_ORDER_RANKS
+    if ranks[chess.letters[to_square]] >= ranks[chess.letters[from_square]]:
+        return False
+    return e.is_square_attacked(chess, to_square, piece_sign)
+
+
+def quiesce(chess, piece_sign, alpha, beta):
+    """
+    Quiescence Search
+    Stopping the search at a fixed depth stops it in the middle of
+    exchanges of pieces e.g. a Queen taking a Pawn scores well
+    if the search stops before the Queen is taken back
+    So at the deepest level 'evaluate' calls this function instead,
+    which goes on evaluating captures, and only captures,
+    until the position is quiet i.e. no capture is worth making
+
+    The score and the window are as for 'evaluate'
+    'Stand pat': the user to move need not capture anything
+    and then the score is that of the position as it stands
+    i.e. the score kept by Game - see piece_square.py
+    So a capture is only made when it scores better than not capturing
+    'Delta pruning': a capture is skipped if even the value of the piece
+    taken plus QUIESCENCE_DELTA_MARGIN cannot raise the score to alpha
+    """
+
+    Game.search_nodes += 1
+    if Game.search_depth > 1 and search_budget_exhausted():
+        raise SearchBudgetExhausted()
+
+    # Stand pat
+    # If not capturing is already good enough, no moves need be generated
+    stand_pat = piece_sign * chess.position_score
+    bestscore = stand_pat
+    if bestscore >= beta:
+        return bestscore
+    if bestscore > alpha:
+        alpha = bestscore
+
+    # The captures are tried in MVV-LVA order - see ordering.py
+    captures = e.legal_movelist(chess, piece_sign, captures_only=True)
+    for move in order_moves(chess, captures):
+        # Delta pruning
+        most = (stand_pat + captured_value(chess, move, piece_sign)
+                + constants.QUIESCENCE_DELTA_MARGIN)
+        if most <= alpha:
+            # The capture would score no more than about this
+            # so the score returned is still a bound on the true score
+            bestscore = max(bestscore, most)
+            continue
+        if is_losing_capture(chess, move, piece_sign):
+            continue
+
+        chess.make_move(move)
+        score = -quiesce(chess, -piece_sign, -beta, -alpha)
+        chess.unmake_move()
+
+        if score > bestscore:
+            bestscore = score
+            if score > alpha:
+                alpha = score
+                if alpha >= beta:
+                    break
+
+    return bestscore
+
+
+def search_budget_exhausted():
+    """
+    Has the Computer run out of time or run out of positions to evaluate?
+    A Lazy SMP helper also stops when the main process has finished
+    """
+
+    if Game.stop_search is not None and Game.stop_search.value:
+        return True
+
+    if (Game.search_node_limit is not None
+       and Game.search_nodes >= Game.search_node_limit):
+        return True
+
+    return (Game.search_deadline is not None
+            and perf_counter() >= Game.search_deadline)
+
+
+def think(chess, max_depth=None):
+    """
+    Iterative Deepening
+    Rather than evaluate to a fixed depth,
+    'evaluate' is called to a depth of 1 move, then 2 moves, then 3 ...
+    until the time budget or the node budget runs out
+    (or 'max_depth', by default MAXLEVEL, is reached)
+    An unfinished iteration is abandoned and the best move
+    of the last completed iteration is played
+
+    Each iteration is quick compared with the next one
+    and it leaves the transposition table filled with results
+    that the next iteration can use
+    Return the score of the last completed iteration
+
+    With more than one thread, helper processes search alongside
+    (Lazy SMP) or the root moves are shared out among worker processes
+    - see parallel.py
+    """
+
+    if max_depth is None:
+        max_depth = constants.MAXLEVEL
+    if parallel.process_pool is None:
+        return iterative_deepening(chess, max_depth)
+    if constants.PARALLEL_SEARCH == constants.ROOT_SPLIT:
+        return parallel.think_in_parallel(chess, max_depth)
+    return parallel.think_lazy_smp(chess, max_depth, iterative_deepening)
+
+
+def aspiration_search(chess, depth, previous_score):
+    """
+    Aspiration Windows
+    Evaluate the position to 'depth' at the top level
+    The score is unlikely to be far from 'previous_score',
+    the score of the previous depth (None if there is none)
+    So rather than the widest window, the search starts with
+    a narrow window around it: previous_score +/- ASPIRATION_DELTA
+    More of the search is then cut short
+    If the score falls outside the window ('fails low' or 'fails high')
+    it is only a bound on the true score, so the position is evaluated
+    again with the window widened on that side, past the score found,
+    by ASPIRATION_WIDENING times as much each time
+    Each window searched is recorded in Game.aspiration_windows
+    Return the score
+    """
+
+    if (not constants.ASPIRATION_WINDOWS
+       or depth < constants.ASPIRATION_MIN_DEPTH
+       or previous_score is None):
+        (alpha, beta) = (-constants.INFINITE_SCORE, constants.INFINITE_SCORE)
+    else:
+        alpha = max(previous_score - constants.ASPIRATION_DELTA,
+                    -constants.INFINITE_SCORE)
+        beta = min(previous_score + constants.ASPIRATION_DELTA,
+                   constants.INFINITE_SCORE)
+    delta = constants.ASPIRATION_DELTA
+
+    while True:
+        nodes = Game.search_nodes
+        score = evaluate(chess, 0, constants.COMPUTER, alpha, beta, depth)
+        Game.aspiration_windows.append((depth, alpha, beta, score,
+                                        Game.search_nodes - nodes))
+
+        delta *= constants.ASPIRATION_WIDENING
+        if score <= alpha and alpha > -constants.INFINITE_SCORE:
+            # Failed low: every move scored at most this
+            alpha = max(score - delta, -constants.INFINITE_SCORE)
+        elif score >= beta and beta < constants.INFINITE_SCORE:
+            # Failed high: a move scored at least this
+            beta = min(score + delta, constants.INFINITE_SCORE)
+        else:
+            return score
+
+
+def iterative_deepening(chess, max_depth, first_depth=1, set_budget=True):
+    """
+    The search of 'think' in this process alone
+    from a depth of 'first_depth' up to 'max_depth'
+    Unless 'set_budget' is False, the search budget is set from constants
+    Otherwise the caller sets Game.search_deadline and
+    Game.search_node_limit itself e.g. to stop on another's signal
+    """
+
+    if set_budget:
+        if constants.SEARCH_TIME_SECONDS is None:
+            Game.search_deadline = None
+        else:
+            Game.search_deadline = (perf_counter()
+                                    + constants.SEARCH_TIME_SECONDS)
+        Game.search_node_limit = constants.SEARCH_NODE_BUDGET
+    Game.completed_depth = 0
+    Game.aspiration_windows = []
+
+    # How many moves were made before the search began
+    start_ply = chess.ply
+    result = constants.EVALUATE_THRESHOLD_SCORE
+    best_move = constants.NO_MOVE
+
+    for depth in range(first_depth, max_depth + 1):
+        Game.search_depth = depth
+        previous_score = result if Game.completed_depth else None
+        try:
+            iteration_result = aspiration_search(chess, depth,
+                                                 previous_score)
+        except SearchBudgetExhausted:
+            # Take back the moves (and null moves)
+            # of the abandoned iteration
+            while chess.ply > start_ply:
+                if chess.last_move() == constants.NO_MOVE:
+                    chess.unmake_null_move()
+                else:
+                    chess.unmake_move()
+            break
+
+        result = iteration_result
+        best_move = Game.best_move
+        Game.principal_variation = Game.pv_table[1][1:Game.pv_lengths[1]]
+        Game.completed_depth = depth
+        if search_budget_exhausted():
+            # No time to start another iteration
+            break
+
+    Game.best_move = best_move
+    return result
+
+
 def execute_computer_move(chess, from_file, from_rank, to_file, to_rank):
     """
     Carry out the chess move that was produced
@@ -414,17 +749,28 @@ def execute_computer_move(chess, from_file, from_rank, to_file, to_rank):
     'Kings' cannot actually be taken in Chess!
     """
 
-    from_square = from_file + from_rank
-    to_square = to_file + to_rank
+    from_square = constants.SQUARE_INDEX[from_file + from_rank]
+    to_square = constants.SQUARE_INDEX[to_file + to_rank]
     taken = is_piece_taken(chess, to_file, to_rank, piece_sign)
     # No error raised - so the above test passed
 
+    if (attacking_piece_letter == constants.PAWN_LETTER
+       and from_file != to_file and taken is None):
+        # A Pawn moving diagonally on to a blank square
+        # is an En Passant move generated by 'evaluate'
+        # The Pawn taken is beside the square moved from
+        chess.set_square(to_square - 10 * piece_sign, None)
+        Game.show_taken_message = "Computer took your Pawn en passant"
+        taken = constants.PAWN_VALUE
+        m.reset_2squares_pawn_positions(constants.PLAYER)
+
     # Make the Computer's move
-    e.make_move_to_square(chess, from_square, to_square, to_file, to_rank)
+    e.make_move_to_square(chess, from_square, to_square)
 
+    # 'evaluate' only generates legal moves
+    # However, a move read from the input file might not be one
     # If the COMPUTER cannot play out of check then resign
-    check_flag = in_check(chess, constants.COMPUTER)
-    if check_flag:
+    if Game.reading_game_file and in_check(chess, constants.COMPUTER):
         e.computer_resigns()
         # *** END PROGRAM ***
 
@@ -447,9 +793,10 @@ def execute_computer_move(chess, from_file, from_rank, to_file, to_rank):
                                             to_file, to_rank, taken)
 
 
-def process_computer_move(chess, from_file, from_rank, to_file, to_rank):
+def process_computer_move(chess, move):
     """
     This routine handles the playing of the Computer's move
+    'move' is the packed move generated by the 'evaluate' function
     """
 
     move_finalised = False
@@ -471,6 +818,10 @@ def process_computer_move(chess, from_file, from_rank, to_file, to_rank):
         e.computer_resigns()
         # *** END PROGRAM ***
 
+    # Turn the move into the squares' names, ready for output
+    (from_file, from_rank, to_file, to_rank) = encoding.move_names(move)
+    the_tuple = (move_finalised, from_file, from_rank, to_file, to_rank)
+
     # Are the Chess moves currently coming from an input file?
     # If so, fetch the next move from there
     if Game.reading_game_file:
@@ -481,6 +832,13 @@ def process_computer_move(chess, from_file, from_rank, to_file, to_rank):
          from_file, from_rank,
          to_file, to_rank) = the_tuple
 
+    # Did the 'evaluate' function generate a Castling Move?
+    if not Game.reading_game_file and not move_finalised:
+        if encoding.flags_of(move) == constants.KINGSIDE_CASTLE:
+            Game.evaluate_castle_move = constants.CASTLING_KINGSIDE
+        elif encoding.flags_of(move) == constants.QUEENSIDE_CASTLE:
+            Game.evaluate_castle_move = constants.CASTLING_QUEENSIDE
+
     """
     At this stage, three possibilities
     # 1) 'evaluate' function generated a Castling Move
@@ -643,6 +1001,8 @@ def player_move_validation_loop(chess, from_file, from_rank, to_file, to_rank):
         if not Game.reading_game_file:
             # In the case of No. 2)
             # fetch the next move from the player from the keyboard
+            # Meanwhile the Computer thinks about its next move
+            ponder.start_pondering(chess)
             (do_next, lower_string) = e.handle_player_move_from_keyboard(chess)
             if do_next == "return":
                 return
@@ -774,13 +1134,16 @@ def player_move_validation_loop(chess, from_file, from_rank, to_file, to_rank):
         return
 
 
-def play_2_moves(chess, from_file, from_rank, to_file, to_rank, result):
+def play_2_moves(chess, move, result):
     """
     1) Play and show the result of the Computer move
     2) Then get, validate and play the Player's move
+    'move' is the Computer's packed move
+    It is turned into the squares' names only for output
     """
 
-    process_computer_move(chess, from_file, from_rank, to_file, to_rank)
+    process_computer_move(chess, move)
+    (from_file, from_rank, to_file, to_rank) = encoding.move_names(move)
     player_move_validation_loop(chess, from_file, from_rank, to_file, to_rank)
 
 
@@ -796,6 +1159,10 @@ def main_part2():
     """
 
     chess = Game()
+    # Kept from one of the Computer's moves to the next
+    Game.transposition_table = TranspositionTable(
+        constants.TRANSPOSITION_TABLE_MB)
+    parallel.start_process_pool(constants.SEARCH_THREADS)
 
     f.open_input_file()
 
@@ -805,28 +1172,108 @@ def main_part2():
 
     # Game Loop
     while True:
-        play_2_moves(chess,
-                     Game.best_from_file,
-                     Game.best_from_rank,
-                     Game.best_to_file,
-                     Game.best_to_rank,
-                     Game.evaluation_result)
-
-        # This stack is for the undo-ing of Pawn Promotions
-        # It Grows and Shrinks with the calling of the 'evaluate' function
-        Game.undo_stack = []
-        Game.evaluating = True
-
-        Game.evaluation_result = evaluate(chess, 0,
-                                          constants.COMPUTER,
-                                          constants.EVALUATE_THRESHOLD_SCORE)
+        play_2_moves(chess, Game.best_move, Game.evaluation_result)
+
+        # Bring the position's castling rights and en passant square
+        # up to date before evaluating
+        m.set_up_position_state(chess, constants.COMPUTER)
+        if not ponder.pondering():
+            Game.transposition_table.new_search()
+            age_move_ordering()
+
+        # On a ponder hit, the search is already under way - see ponder.py
+        Game.evaluation_result = ponder.finish_pondering(chess)
+        if Game.evaluation_result is None:
+            Game.search_nodes = 0
+            Game.evaluation_result = think(chess)
 
         # Reset variables
-        Game.evaluating = False
-        Game.undo_stack = None
         Game.promoted_piece = ""
 
 
+def parse_arguments():
+    """
+    The command line options
+    Without any, the Chess Program is played as usual
+    """
+
+    parser = argparse.ArgumentParser(description="Kool AI Chess")
+    parser.add_argument("--movegen", metavar="GENERATOR",
+                        choices=(constants.MAILBOX_GENERATOR,
+                                 constants.BITBOARD_GENERATOR),
+                        default=constants.MOVE_GENERATOR,
+                        help="which move generator to use: 'mailbox' "
+                             "or 'bitboard'")
+    parser.add_argument("--compare-movegen", nargs="*", metavar="PGN",
+                        help="compare the mailbox and bitboard move "
+                             "generators over the games of the PGN files "
+                             "(by default testdata/*.pgn) "
+                             "- see compare_movegen.py")
+    parser.add_argument("--perft", type=int, nargs="?", const=0,
+                        metavar="DEPTH",
+                        help="count the leaf nodes of the move generator "
+                             "for the reference positions - see perft.py")
+    parser.add_argument("--fen",
+                        help="with --perft, the position to count instead")
+    parser.add_argument("--divide", action="store_true",
+                        help="with --perft, show the count for each move")
+    parser.add_argument("--hash", type=int, metavar="MB",
+                        default=constants.TRANSPOSITION_TABLE_MB,
+                        help="the most memory that the transposition table "
+                             "may take, in megabytes")
+    parser.add_argument("--time", type=float, metavar="SECONDS",
+                        default=constants.SEARCH_TIME_SECONDS,
+                        help="how long the Computer may think about a move "
+                             "(0 for no limit, but only together with "
+                             "--nodes)")
+    parser.add_argument("--nodes", type=int, metavar="N",
+                        default=constants.SEARCH_NODE_BUDGET,
+                        help="the most positions the Computer may evaluate "
+                             "for a move")
+    parser.add_argument("--threads", type=int, metavar="N",
+                        default=constants.SEARCH_THREADS,
+                        help="how many processes search at once; "
+                             "with --bench, compare 1 up to N")
+    parser.add_argument("--parallel", metavar="MODE",
+                        choices=(constants.LAZY_SMP, constants.ROOT_SPLIT),
+                        default=constants.PARALLEL_SEARCH,
+                        help="with --threads, how the processes share out "
+                             "the search: 'lazy' (Lazy SMP) or 'root' "
+                             "(the root moves)")
+    parser.add_argument("--no-aspiration", action="store_true",
+                        help="switch off Aspiration Windows")
+    parser.add_argument("--aspiration-delta", type=int, metavar="N",
+                        default=constants.ASPIRATION_DELTA,
+                        help="how far either side of the previous score "
+                             "the first Aspiration Window reaches")
+    parser.add_argument("--no-ponder", action="store_true",
+                        help="do not think whilst the Player thinks")
+    parser.add_argument("--bench", type=int, nargs="?", const=0,
+                        metavar="DEPTH",
+                        help="search the benchmark positions to a fixed "
+                             "depth - see bench.py")
+    parser.add_argument("--no-null-move", action="store_true",
+                        help="switch off Null Move Pruning")
+    parser.add_argument("--null-move-reduction", type=int, metavar="R",
+                        default=constants.NULL_MOVE_REDUCTION,
+                        help="how many moves less deeply "
+                             "the null move is evaluated")
+    parser.add_argument("--no-lmr", action="store_true",
+                        help="switch off Late Move Reductions")
+    parser.add_argument("--lmr-reduction", type=int, metavar="N",
+                        default=constants.LMR_REDUCTION,
+                        help="how many moves less deeply "
+                             "a late move is evaluated")
+    arguments = parser.parse_args()
+    if arguments.time is not None and arguments.time < 0:
+        parser.error("--time cannot be less than 0")
+    if not arguments.time and arguments.nodes is None:
+        # With no budget at all, each search would carry on to MAXLEVEL
+        # which would take far too long
+        parser.error("--time 0 needs a budget of positions i.e. --nodes N")
+    return arguments
+
+
 def main():
     """
     Main Routine
@@ -834,6 +1281,38 @@ def main():
     Report any errors
     """
 
+    arguments = parse_arguments()
+    constants.MOVE_GENERATOR = arguments.movegen
+    if arguments.compare_movegen is not None:
+        # Test the move generators against each other rather than play
+        all_equal = compare_movegen.compare_move_generators(
+            arguments.compare_movegen)
+        sys.exit(0 if all_equal else 1)
+
+    if arguments.perft is not None:
+        # Test the move generator rather than play
+        all_correct = perft.perft_command(arguments.perft or None,
+                                          arguments.fen, arguments.divide)
+        sys.exit(0 if all_correct else 1)
+
+    constants.TRANSPOSITION_TABLE_MB = arguments.hash
+    constants.SEARCH_TIME_SECONDS = arguments.time or None
+    constants.SEARCH_NODE_BUDGET = arguments.nodes
+    constants.NULL_MOVE_PRUNING = not arguments.no_null_move
+    constants.NULL_MOVE_REDUCTION = arguments.null_move_reduction
+    constants.LATE_MOVE_REDUCTIONS = not arguments.no_lmr
+    constants.LMR_REDUCTION = arguments.lmr_reduction
+    constants.ASPIRATION_WINDOWS = not arguments.no_aspiration
+    constants.ASPIRATION_DELTA = arguments.aspiration_delta
+    constants.SEARCH_THREADS = arguments.threads
+    constants.PARALLEL_SEARCH = arguments.parallel
+    constants.PONDERING = not arguments.no_ponder
+    if arguments.bench is not None:
+        # Measure the search rather than play
+        bench.bench_command(think, arguments.bench or None,
+                            arguments.threads)
+        sys.exit(0)
+
     try:
         main_part2()
     except CustomException as error:
@@ -0,0 +1,283 @@
+"""
+transposition.py
+The Transposition Table
+
+The same position is often reached by playing the same moves
+in a different order e.g. Nf3 then e4 or e4 then Nf3
+Rather than evaluate such a position afresh, 'evaluate' records
+the result of each position it evaluates in this table,
+keyed by the position's Zobrist hash key - see zobrist.py
+It then looks the position up before evaluating it
+
+Each entry holds
+    the hash key of the position
+    the depth to which the position was evaluated
+    the score
+    the bound i.e. whether the score is exact or only a bound
+        on the true score because the evaluation was cut short
+    the best move found (a packed move - see encoding.py)
+    the age i.e. which of the Computer's searches stored the entry
+
+The table has a fixed number of entries so that its memory is bounded
+The entries are held in arrays of fixed-size numbers rather than
+in lists of Python objects, so the memory used is known exactly
+
+Replacement Policy
+The entries come in pairs (buckets) and the hash key picks the pair
+1) The first entry is 'depth-preferred': it is only replaced
+   by a result of the same or greater depth, or when it is
+   left over from an earlier search
+2) The second entry is 'always-replace': any result
+   that cannot go into the first entry goes here
+So the deep, expensive results are kept
+while the most recent results are still recorded
+
+The Shared Transposition Table
+When several processes search at once (see parallel.py)
+they share one table held in shared memory - SharedTranspositionTable
+Each entry is two 64-bit words: the hash key XOR-ed with the rest
+of the entry packed into one number, then that number by itself
+There are no locks, so two processes may write an entry at the same time
+and leave it half one and half the other
+Such an entry is ignored, since its first word XOR-ed with its second
+no longer gives the hash key of the position being looked up
+"""
+
+from array import array
+from multiprocessing import shared_memory
+
+import constants
+
+
+# The bytes taken by one entry:
+# key 8, score 4, move 2, depth 1, bound 1, age 1
+ENTRY_BYTES = 17
+
+# The bytes taken by one entry of the shared table: two 64-bit words
+SHARED_ENTRY_BYTES = 16
+# Where each part of an entry is packed into the shared table's number
+# The score is stored plus SCORE_OFFSET so that it is never negative
+SCORE_OFFSET = 1 << 31
+MOVE_SHIFT = 32
+DEPTH_SHIFT = 48
+BOUND_SHIFT = 54
+AGE_SHIFT = 56
+
+
+class TranspositionTable:
+    """
+    A fixed-size table of evaluated positions
+    """
+
+    def __init__(self, megabytes=constants.TRANSPOSITION_TABLE_MB):
+        """
+        Allocate the largest table whose size is a power of two
+        (two entries per bucket) that fits within 'megabytes'
+        """
+
+        buckets = 1
+        while buckets * 4 * ENTRY_BYTES <= megabytes * 1024 * 1024:
+            buckets *= 2
+        self.size = buckets * 2
+        # The hash key is AND-ed with 'mask' to pick the bucket
+        self.mask = buckets - 1
+
+        self.keys = array("Q", bytes(8 * self.size))
+        self.scores = array("i", bytes(4 * self.size))
+        self.moves = array("H", bytes(2 * self.size))
+        self.depths = array("B", bytes(self.size))
+        self.bounds = array("B", bytes(self.size))
+        self.ages = array("B", bytes(self.size))
+
+        # Every entry starts off as left over from an earlier search
+        self.age = 1
+
+        # Statistics
+        self.probes = 0
+        self.hits = 0
+        self.stores = 0
+
+    def new_search(self):
+        """
+        Called before each of the Computer's searches
+        The entries stored before now may be replaced at any depth
+        """
+
+        # The age counts 1 to 255 then wraps around
+        self.age = self.age % 255 + 1
+        self.probes = 0
+        self.hits = 0
+        self.stores = 0
+
+    def probe(self, key):
+        """
+        Look up the position whose hash key is 'key'
+        Return the tuple (depth, score, bound, move)
+        or None if the position is not in the table
+        """
+
+        self.probes += 1
+        slot = (key & self.mask) << 1
+        keys = self.keys
+        if keys[slot] != key:
+            slot += 1
+            if keys[slot] != key:
+                return None
+
+        self.hits += 1
+        return (self.depths[slot], self.scores[slot],
+                self.bounds[slot], self.moves[slot])
+
+    def store(self, key, depth, score, bound, move):
+        """
+        Record the result of evaluating the position whose hash key is 'key'
+        See the Replacement Policy above
+        """
+
+        self.stores += 1
+        slot = (key & self.mask) << 1
+        if (self.keys[slot] != key
+           and self.depths[slot] > depth
+           and self.ages[slot] == self.age):
+            # Keep the deeper result; use the 'always-replace' entry
+            slot += 1
+
+        self.keys[slot] = key
+        self.depths[slot] = depth
+        self.scores[slot] = score
+        self.bounds[slot] = bound
+        self.moves[slot] = move
+        self.ages[slot] = self.age
+
+
+class SharedTranspositionTable:
+    """
+    A fixed-size table of evaluated positions in shared memory
+    that every search process uses at once
+    It works as TranspositionTable does (see above)
+    but each entry is packed into two 64-bit words
+
+        word 1  the hash key XOR word 2
+        word 2  bits  0 to 31  score + SCORE_OFFSET
+                bits 32 to 47  move
+                bits 48 to 53  depth
+                bits 54 to 55  bound
+                bits 56 to 63  age
+
+    The first word of the shared memory holds the current age
+    so that every process stores its entries with the same age
+    """
+
+    def __init__(self, megabytes=constants.TRANSPOSITION_TABLE_MB,
+                 name=None):
+        """
+        Create the table, the largest whose size is a power of two
+        (two entries per bucket) that fits within 'megabytes'
+        or, given the 'name' of its shared memory, use a table
+        that another process has created
+        """
+
+        buckets = 1
+        while buckets * 4 * SHARED_ENTRY_BYTES <= megabytes * 1024 * 1024:
+            buckets *= 2
+        self.size = buckets * 2
+        self.mask = buckets - 1
+
+        # One word for the age then two words for each entry
+        memory_bytes = 8 + self.size * SHARED_ENTRY_BYTES
+        if name is None:
+            self.shared_memory = shared_memory.SharedMemory(
+                create=True, size=memory_bytes)
+        else:
+            self.shared_memory = shared_memory.SharedMemory(name=name)
+        self.name = self.shared_memory.name
+        self.words = self.shared_memory.buf.cast("Q")
+        if name is None:
+            self.clear()
+
+        # Statistics of this process's use of the table
+        self.probes = 0
+        self.hits = 0
+        self.stores = 0
+
+    def clear(self):
+        """
+        Empty the table
+        Every entry starts off as left over from an earlier search
+        """
+
+        memory = self.shared_memory.buf
+        memory[:len(self.words) * 8] = bytes(len(self.words) * 8)
+        self.words[0] = 1
+
+    def close(self, remove=False):
+        """
+        Stop using the shared memory
+        The process that created the table also removes it
+        """
+
+        self.words.release()
+        self.shared_memory.close()
+        if remove:
+            self.shared_memory.unlink()
+
+    def new_search(self):
+        """
+        Called by the main process before each of the Computer's searches
+        The entries stored before now may be replaced at any depth
+        """
+
+        # The age counts 1 to 255 then wraps around
+        self.words[0] = self.words[0] % 255 + 1
+        self.probes = 0
+        self.hits = 0
+        self.stores = 0
+
+    def probe(self, key):
+        """
+        Look up the position whose hash key is 'key'
+        Return the tuple (depth, score, bound, move)
+        or None if the position is not in the table
+        """
+
+        self.probes += 1
+        words = self.words
+        # Word 0 is the age so entries begin at word 1
+        index = ((key & self.mask) << 2) + 1
+        data = words[index + 1]
+        if words[index] ^ data != key:
+            index += 2
+            data = words[index + 1]
+            if words[index] ^ data != key:
+                return None
+
+        self.hits += 1
+        return ((data >> DEPTH_SHIFT) & 63,
+                (data & 0xFFFFFFFF) - SCORE_OFFSET,
+                (data >> BOUND_SHIFT) & 3,
+                (data >> MOVE_SHIFT) & 0xFFFF)
+
+    def store(self, key, depth, score, bound, move):
+        """
+        Record the result of evaluating the position whose hash key is 'key'
+        See the Replacement Policy above
+        """
+
+        self.stores += 1
+        words = self.words
+        age = words[0]
+        index = ((key & self.mask) << 2) + 1
+        data = words[index + 1]
+        if (words[index] ^ data != key
+           and (data >> DEPTH_SHIFT) & 63 > depth
+           and data >> AGE_SHIFT == age):
+            # Keep the deeper result; use the 'always-replace' entry
+            index += 2
+
+        data = ((score + SCORE_OFFSET)
+                | move << MOVE_SHIFT
+                | depth << DEPTH_SHIFT
+                | bound << BOUND_SHIFT
+                | age << AGE_SHIFT)
+        words[index] = key ^ data
+        words[index + 1] = data
@@ -0,0 +1,84 @@
+"""
+zobrist.py
+Zobrist Hashing
+
+Every position is given a 64-bit key, its hash key
+A random 64-bit number is chosen once for
+1) each kind of piece of each colour on each square
+2) the Computer being the side to move
+3) each combination of the castling rights
+4) each file of an en passant square
+The key of a position is all the numbers that apply to it
+combined with exclusive or (XOR)
+
+Since x ^ y ^ y == x, a change to the position changes the key
+by XOR-ing in and out just the numbers of what has changed
+So the key is kept up to date as the board changes
+rather than calculated afresh - see Game.set_square and Game.make_move
+
+Two positions with the same key are, in all likelihood, the same position
+This is what transposition tables and repetition detection rely on
+"""
+
+import random
+
+import constants
+
+
+# The random numbers are always the same ones so that
+# a position has the same key every time that the program is run
+ZOBRIST_SEED = 1884
+
+random_numbers = random.Random(ZOBRIST_SEED)
+
+# For each colour and piece letter, a number for each mailbox index
+# The border squares are never used
+PIECE_KEYS = {}
+for sign in (constants.PLAYER, constants.COMPUTER):
+    PIECE_KEYS[sign] = {}
+    for letter in (constants.KING_LETTER, constants.QUEEN_LETTER,
+                   constants.ROOK_LETTER, constants.BISHOP_LETTER,
+                   constants.KNIGHT_LETTER, constants.PAWN_LETTER):
+        PIECE_KEYS[sign][letter] = [random_numbers.getrandbits(64)
+                                    for _ in range(constants.MAILBOX_SIZE)]
+
+# Included when the Computer (Black) is to move
+SIDE_KEY = random_numbers.getrandbits(64)
+
+# Indexed by the castling rights (see constants.py)
+# No castling rights at all has the key 0
+CASTLING_KEYS = [0] + [random_numbers.getrandbits(64)
+                       for _ in range(constants.ALL_CASTLING_RIGHTS)]
+
+# Indexed by the file (0 for 'a' ... 7 for 'h') of the en passant square
+EN_PASSANT_KEYS = [random_numbers.getrandbits(64) for _ in range(8)]
+
+
+def en_passant_key(en_passant_square):
+    """
+    The number for an en passant square (a mailbox index) or 0 for None
+    """
+
+    if en_passant_square is None:
+        return 0
+    # The mailbox has a border of one square on the left hand side
+    return EN_PASSANT_KEYS[en_passant_square % 10 - 1]
+
+
+def calculate_hash_key(chess):
+    """
+    Calculate the key of the position from scratch
+    Used to set up the key and to check the key kept by Game
+    """
+
+    key = 0
+    for square in constants.BOARD_SQUARES:
+        the_piece = chess.board[square]
+        if the_piece is not None:
+            key ^= PIECE_KEYS[the_piece.sign][chess.letters[square]][square]
+
+    if chess.side_to_move == constants.COMPUTER:
+        key ^= SIDE_KEY
+    key ^= CASTLING_KEYS[chess.castling_rights]
+    key ^= en_passant_key(chess.en_passant_square)
+    return key